@@ -0,0 +1,128 @@
+import numpy as np
+
+def to_mono(audio: np.ndarray) -> np.ndarray:
+    return audio if audio.ndim == 1 else audio.mean(axis=1)
+
+def resample(audio: np.ndarray, sr: int, target_sr: int) -> np.ndarray:
+    """
+    Linear-interpolation resample; plenty for speech and TTS playback.
+    """
+    if sr == target_sr or len(audio) == 0:
+        return audio
+    n = int(round(len(audio) * target_sr / sr))
+    positions = np.linspace(0, len(audio) - 1, n)
+    index = np.arange(len(audio))
+    if audio.ndim == 1:
+        return np.interp(positions, index, audio)
+    return np.stack([np.interp(positions, index, ch) for ch in audio.T], axis=1)
+
+def frame_rms(audio: np.ndarray, frame_len: int) -> np.ndarray:
+    """
+    RMS of consecutive non-overlapping frames; a trailing partial frame is zero-padded.
+    """
+    if len(audio) == 0:
+        return np.zeros(0)
+    n_frames = -(-len(audio) // frame_len)
+    padded = np.zeros(n_frames * frame_len, dtype=np.float64)
+    padded[:len(audio)] = audio
+    return np.sqrt(np.mean(padded.reshape(n_frames, frame_len) ** 2, axis=1))
+
+def trim_silence(audio: np.ndarray, sr: int, frame_ms: int = 20, threshold_ratio: float = 0.1, floor: float = 1e-3, pad_ms: int = 200) -> np.ndarray:
+    """
+    Energy-based VAD: drops leading/trailing frames quieter than
+    `threshold_ratio` of the loud-speech level (95th percentile RMS).
+    Returns an empty array if nothing rises above the floor.
+    """
+    frame_len = max(1, sr * frame_ms // 1000)
+    rms = frame_rms(audio, frame_len)
+    if len(rms) == 0:
+        return audio
+    threshold = max(floor, threshold_ratio * np.percentile(rms, 95))
+    voiced = np.flatnonzero(rms > threshold)
+    if len(voiced) == 0:
+        return audio[:0]
+    pad = sr * pad_ms // 1000
+    start = max(0, voiced[0] * frame_len - pad)
+    end = min(len(audio), (voiced[-1] + 1) * frame_len + pad)
+    return audio[start:end]
+
+def to_pcm16(audio: np.ndarray) -> bytes:
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+def amplitude_envelope(audio: np.ndarray, sr: int, fps: int = 30) -> list[int]:
+    """
+    Per-frame loudness for lip-sync: RMS per 1/fps window, scaled so the
+    loudest frame is 100. Compact enough to ship in every speech object.
+    """
+    rms = frame_rms(to_mono(audio), max(1, sr // fps))
+    peak = rms.max() if len(rms) else 0
+    if peak <= 0:
+        return [0] * len(rms)
+    return np.rint(rms / peak * 100).astype(int).tolist()
+
+def stitch(clips: list[np.ndarray], sr: int, pause_ms: int = 400, fade_ms: int = 5) -> tuple[np.ndarray, list[tuple[int, int]]]:
+    """
+    Concatenates mono clips with `pause_ms` of silence between them, fading
+    each clip's edges so the cuts don't click. Returns the audio and each
+    clip's (offset, length) in samples.
+    """
+    pause = sr * pause_ms // 1000
+    fade = sr * fade_ms // 1000
+    out = np.zeros(sum(len(c) for c in clips) + pause * max(0, len(clips) - 1), dtype=np.float32)
+    spans = []
+    pos = 0
+    for clip in clips:
+        n = len(clip)
+        out[pos:pos + n] = clip
+        f = min(fade, n // 2)
+        if f:
+            ramp = np.linspace(0, 1, f, dtype=np.float32)
+            out[pos:pos + f] *= ramp
+            out[pos + n - f:pos + n] *= ramp[::-1]
+        spans.append((pos, n))
+        pos += n + pause
+    return out, spans
+
+class Endpointer:
+    """
+    Streaming energy VAD for live microphone audio. Feed mono samples as
+    they are decoded; `ended` turns True once at least `min_speech_ms` of
+    speech has been followed by `silence_ms` of quiet. Loudness is judged
+    against the loudest frame so far, like `trim_silence`.
+    """
+
+    def __init__(self, sr: int, frame_ms: int = 20, silence_ms: int = 700, min_speech_ms: int = 200,
+                 threshold_ratio: float = 0.1, floor: float = 1e-3):
+        self.frame_len = max(1, sr * frame_ms // 1000)
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.threshold_ratio = threshold_ratio
+        self.floor = floor
+        self.peak = 0.0
+        self.speech_frames = 0
+        self.quiet_frames = 0
+        self.ended = False
+        self._pending = np.zeros(0)
+
+    @property
+    def heard_speech(self) -> bool:
+        return self.speech_frames >= self.min_speech_frames
+
+    def feed(self, samples: np.ndarray) -> bool:
+        audio = np.concatenate([self._pending, samples])
+        n_frames = len(audio) // self.frame_len
+        self._pending = audio[n_frames * self.frame_len:]
+        if self.ended or n_frames == 0:
+            return self.ended
+        frames = audio[:n_frames * self.frame_len].reshape(n_frames, self.frame_len)
+        for rms in np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1)):
+            self.peak = max(self.peak, rms)
+            if rms > max(self.floor, self.threshold_ratio * self.peak):
+                self.speech_frames += 1
+                self.quiet_frames = 0
+            elif self.heard_speech:
+                self.quiet_frames += 1
+                if self.quiet_frames >= self.silence_frames:
+                    self.ended = True
+                    break
+        return self.ended
@@ -0,0 +1,200 @@
+import os
+import time
+import uuid
+import asyncio
+from pathlib import Path
+from state import default_backend
+
+AUDIO_STORE_DIR = os.getenv("AUDIO_STORE_DIR", "artifacts/audio")
+# Seconds a generated line stays downloadable
+AUDIO_TTL_S = float(os.getenv("AUDIO_TTL_S", "86400"))
+# Oldest files are removed first once the store grows past this
+AUDIO_QUOTA_BYTES = int(os.getenv("AUDIO_QUOTA_BYTES", str(1024 * 1024 * 1024)))
+AUDIO_SWEEP_INTERVAL_S = float(os.getenv("AUDIO_SWEEP_INTERVAL_S", "60"))
+# With a shared backend, how long another worker waits for a line still being streamed in before giving up
+LIVE_WAIT_S = float(os.getenv("LIVE_WAIT_S", "30"))
+
+MIME_TYPES = {"mp3": "audio/mpeg", "ogg": "audio/ogg", "wav": "audio/wav"}
+
+class Artifact:
+    def __init__(self, artifact_id: str, ext: str, path: Path, session_id: str = "", created: float | None = None, size: int = 0):
+        self.id = artifact_id
+        self.ext = ext
+        self.path = path
+        self.session_id = session_id
+        self.created = created if created is not None else time.time()
+        self.size = size
+
+    @property
+    def filename(self) -> str:
+        return f"{self.id}.{self.ext}"
+
+    @property
+    def url(self) -> str:
+        return f"/audio/{self.filename}"
+
+    @property
+    def media_type(self) -> str:
+        return MIME_TYPES.get(self.ext, "application/octet-stream")
+
+    def to_dict(self) -> dict:
+        return {"ext": self.ext, "session_id": self.session_id, "created": self.created, "size": self.size}
+
+class LiveAudio:
+    """
+    A file still being written: chunks so far, replayable to any number of
+    readers, each of whom then waits for the rest.
+    """
+
+    def __init__(self, artifact: Artifact):
+        self.artifact = artifact
+        self.chunks = []
+        self.done = False
+        self.failed = False
+        self._changed = asyncio.Event()
+
+    def write(self, chunk: bytes):
+        self.chunks.append(chunk)
+        self._wake()
+
+    def finish(self, failed: bool = False):
+        self.done = True
+        self.failed = failed
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def iter_chunks(self):
+        sent = 0
+        while True:
+            while sent < len(self.chunks):
+                yield self.chunks[sent]
+                sent += 1
+            if self.done:
+                if self.failed:
+                    # Ends the response abruptly so the client sees an error, not a short file
+                    raise RuntimeError(f"Synthesis of {self.artifact.filename} failed")
+                return
+            await self._changed.wait()
+
+class AudioStore:
+    """
+    Generated audio files under collision-free IDs, owned by a session and
+    removed by a background sweeper on TTL or when over the disk quota.
+    Metadata lives in the state backend, so with a shared backend any worker
+    can serve or clean up a file another worker wrote.
+    """
+
+    def __init__(self, directory: str = AUDIO_STORE_DIR, ttl: float = AUDIO_TTL_S, quota_bytes: int = AUDIO_QUOTA_BYTES, backend = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self.backend = backend or default_backend()
+        # Files being streamed in by this process, readable before `commit`
+        self._live = {}
+
+        # Files left by a previous run are tracked (unowned) so they still expire
+        for path in self.directory.iterdir():
+            if path.suffix.lstrip(".") in MIME_TYPES:
+                stat = path.stat()
+                artifact = Artifact(path.stem, path.suffix.lstrip("."), path, created=stat.st_mtime, size=stat.st_size)
+                self.backend.add("audio", artifact.id, artifact.to_dict())
+
+    def _artifact(self, artifact_id: str, data: dict) -> Artifact:
+        path = self.directory / f"{artifact_id}.{data['ext']}"
+        return Artifact(artifact_id, data["ext"], path, data["session_id"], data["created"], data["size"])
+
+    def _all(self) -> list[Artifact]:
+        return [self._artifact(artifact_id, data) for artifact_id, data in self.backend.items("audio")]
+
+    def allocate(self, ext: str, session_id: str = "") -> Artifact:
+        """
+        Reserves a unique path for a new file; call `commit` once it is written.
+        """
+        artifact_id = uuid.uuid4().hex
+        return Artifact(artifact_id, ext, self.directory / f"{artifact_id}.{ext}", session_id)
+
+    def commit(self, artifact: Artifact) -> Artifact:
+        artifact.size = artifact.path.stat().st_size
+        self.backend.put("audio", artifact.id, artifact.to_dict())
+        return artifact
+
+    def open_live(self, artifact: Artifact) -> LiveAudio:
+        live = self._live[artifact.id] = LiveAudio(artifact)
+        if self.backend.shared:
+            # Lets other workers know the file is coming (see `wait_committed`)
+            self.backend.put("live", artifact.id, artifact.to_dict())
+        return live
+
+    def live(self, artifact_id: str) -> LiveAudio | None:
+        return self._live.get(artifact_id)
+
+    def close_live(self, artifact_id: str, failed: bool = False):
+        """
+        Call after `commit` (or after a failure): later readers get the file.
+        """
+        live = self._live.pop(artifact_id, None)
+        if live:
+            live.finish(failed)
+            if self.backend.shared:
+                self.backend.delete("live", artifact_id)
+
+    async def wait_committed(self, artifact_id: str, timeout: float = LIVE_WAIT_S, interval: float = 0.1) -> Artifact | None:
+        """
+        Like `get`, but if another worker is still streaming the file in,
+        waits for it to be committed. Only that worker can relay the chunks.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            artifact = self.get(artifact_id)
+            if artifact or not self.backend.shared or self.backend.get("live", artifact_id) is None or time.monotonic() > deadline:
+                return artifact
+            await asyncio.sleep(interval)
+
+    def get(self, artifact_id: str) -> Artifact | None:
+        data = self.backend.get("audio", artifact_id)
+        return self._artifact(artifact_id, data) if data else None
+
+    def owned_by(self, session_id: str) -> list[Artifact]:
+        return [a for a in self._all() if a.session_id == session_id]
+
+    def delete_session(self, session_id: str):
+        for artifact in self.owned_by(session_id):
+            self._remove(artifact)
+
+    def _remove(self, artifact: Artifact):
+        self.backend.delete("audio", artifact.id)
+        artifact.path.unlink(missing_ok=True)
+
+    def total_bytes(self) -> int:
+        return sum(a.size for a in self._all())
+
+    def sweep(self) -> int:
+        """
+        Removes expired files, then the oldest ones until under quota.
+        Returns how many files were removed.
+        """
+        now = time.time()
+        by_age = sorted(self._all(), key=lambda a: a.created)
+        total = sum(a.size for a in by_age)
+        removed = 0
+        for artifact in by_age:
+            if now - artifact.created <= self.ttl and total <= self.quota_bytes:
+                break
+            self._remove(artifact)
+            total -= artifact.size
+            removed += 1
+        return removed
+
+    async def sweep_forever(self, interval: float = AUDIO_SWEEP_INTERVAL_S):
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.sweep)
+                if removed:
+                    print(f"Audio sweeper removed {removed} files")
+            except Exception as e:
+                print(f"Error sweeping audio store: {e}")
+            await asyncio.sleep(interval)
@@ -0,0 +1,264 @@
+"""
+Load test / benchmark for the FastAPI app with every paid provider faked.
+
+Gemini, ElevenLabs and speech recognition are swapped for local stand-ins
+with configurable latency (lognormal, given as median:p95 seconds); the fake
+ElevenLabs streams real MP3 bytes so transcoding and analysis do real work.
+The app is served by an in-process uvicorn on a free localhost port, so no
+keys, external services or separate server are needed.
+
+    python bench.py --requests 50 --concurrency 8
+    python bench.py --scenarios stream,duck --llm-latency 0.8:2.0 --json out.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from io import BytesIO
+
+import numpy as np
+import soundfile as sf
+
+SCENARIOS = ("chat", "stream", "audio", "duck")
+
+def parse_latency(spec: str) -> tuple[float, float]:
+    median, p95 = (float(x) for x in spec.split(":"))
+    return median, p95
+
+class Latency:
+    """Lognormal delay with the given median and 95th percentile (seconds)."""
+
+    def __init__(self, spec: str):
+        self.median, self.p95 = parse_latency(spec)
+        self.sigma = math.log(self.p95 / self.median) / 1.645 if self.p95 > self.median > 0 else 0.0
+
+    def sample(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        return random.lognormvariate(math.log(self.median), self.sigma)
+
+    async def wait(self):
+        await asyncio.sleep(self.sample())
+
+def _speechlike(seconds: float, sr: int) -> np.ndarray:
+    t = np.arange(int(seconds * sr)) / sr
+    # Voiced carrier with a ~4 Hz syllable envelope, roughly like speech
+    carrier = 0.5 * np.sin(2 * np.pi * 140 * t) + 0.2 * np.sin(2 * np.pi * 280 * t)
+    syllables = 0.5 * (1 + np.sin(2 * np.pi * 4 * t)) ** 2 / 2
+    return (carrier * syllables * 0.6).astype("float32")
+
+_mp3_cache = {}
+
+def fake_mp3(word_count: int) -> bytes:
+    """MP3 bytes about as long as ElevenLabs would speak `word_count` words."""
+    seconds = round(max(1.0, word_count * 0.35), 1)
+    if seconds not in _mp3_cache:
+        buf = BytesIO()
+        sf.write(buf, _speechlike(seconds, 44100), 44100, format="MP3")
+        _mp3_cache[seconds] = buf.getvalue()
+    return _mp3_cache[seconds]
+
+def fake_upload(seconds: float = 2.0) -> bytes:
+    buf = BytesIO()
+    sf.write(buf, _speechlike(seconds, 16000), 16000, format="WAV")
+    return buf.getvalue()
+
+LINES = [
+    "HONK! Did someone say bread?",
+    "That is absolutely raw, you donkey!",
+    "Sigh. It probably won't matter anyway.",
+    "Technically, the correct term is 'fewer', not 'less'.",
+    "Oh my gosh, I just love this so much!",
+    "Interesting. Let me think about that for a moment.",
+]
+
+def install_fakes(args):
+    """Patches the provider functions the app calls; must run before traffic."""
+    import orchestrator
+    import speculation
+    import memory
+    import tts_eleven
+    import stt
+
+    llm = Latency(args.llm_latency)
+    tts_first = Latency(args.tts_latency)
+    stt_latency = Latency(args.stt_latency)
+
+    async def generate_reply_async(character, history):
+        await llm.wait()
+        return f"{random.choice(LINES)} ({character['name']} {random.randint(0, 999)})"
+
+    async def generate_script_async(speakers, history):
+        await llm.wait()
+        return [{"speaker": s["name"], "text": f"{random.choice(LINES)} ({random.randint(0, 999)})", "mood": ""} for s in speakers]
+
+    async def summarize_async(summary, lines):
+        await llm.wait()
+        return (summary + " " + " ".join(line[:20] for line in lines))[-400:]
+
+    orchestrator.generate_reply_async = generate_reply_async
+    orchestrator.generate_script_async = generate_script_async
+    speculation.generate_reply_async = generate_reply_async
+    memory.summarize_async = summarize_async
+
+    class FakeTextToSpeech:
+        async def convert(self, voice_id, *, text, output_format=None, **kwargs):
+            data = fake_mp3(len(text.split()))
+            await tts_first.wait()
+            # Stream in ~4 KB chunks, like the real API
+            for i in range(0, len(data), 4096):
+                yield data[i:i + 4096]
+                await asyncio.sleep(0.005)
+
+    class FakeElevenLabs:
+        text_to_speech = FakeTextToSpeech()
+
+    tts_eleven.async_client = FakeElevenLabs()
+
+    class FakeRecognizer:
+        def recognize(self, audio_data):
+            time.sleep(stt_latency.sample())
+            return "what do the ducks think about my startup idea"
+
+    stt.register_recognizer("bench", FakeRecognizer)
+    stt.STT_BACKEND = "bench"
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else float("nan")
+
+async def run_scenario(client, scenario: str, args, upload: bytes) -> dict:
+    latencies, first_audio, errors = [], [], 0
+    counter = iter(range(args.requests))
+
+    async def one(session_id: str):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            if scenario == "chat":
+                r = await client.post("/chat", json={"message": "Should I quit my job?", "session_id": session_id, "audio_format": args.audio_format})
+                r.raise_for_status()
+            elif scenario == "stream":
+                got_first = False
+                async with client.stream("POST", "/chat/stream", json={"message": "Should I quit my job?", "session_id": session_id, "audio_format": args.audio_format}) as r:
+                    r.raise_for_status()
+                    async for line in r.aiter_lines():
+                        if line == "event: speech" and not got_first:
+                            first_audio.append(time.perf_counter() - start)
+                            got_first = True
+                        elif line == "event: error":
+                            raise RuntimeError("stream reported an error")
+            elif scenario == "audio":
+                r = await client.post(
+                    "/chat-audio",
+                    files={"audio": ("audio.wav", upload, "audio/wav")},
+                    data={"user_name": "Bench", "mode": "chat", "turns": "3", "session_id": session_id, "audio_format": args.audio_format},
+                )
+                r.raise_for_status()
+            else:
+                r = await client.post("/chat/duck", json={"duck_id": random.randint(1, 5), "session_id": session_id, "audio_format": args.audio_format})
+                r.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            errors += 1
+            print(f"{scenario} request failed: {e!r}", file=sys.stderr)
+
+    async def worker(w: int):
+        # One session per worker: its requests never overlap, so none supersedes another
+        session_id = "bench" if args.shared_session else f"bench-{scenario}-{w}"
+        for _ in counter:
+            await one(session_id)
+
+    wall = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(args.concurrency)))
+    wall = time.perf_counter() - wall
+
+    result = {
+        "scenario": scenario,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+    }
+    if first_audio:
+        result.update({
+            "first_audio_p50_s": percentile(first_audio, 50),
+            "first_audio_p95_s": percentile(first_audio, 95),
+            "first_audio_p99_s": percentile(first_audio, 99),
+        })
+    return result
+
+async def main(args):
+    import httpx
+    import uvicorn
+
+    install_fakes(args)
+    import main as app_module
+
+    # A real server on localhost, so streamed responses arrive incrementally
+    # (httpx's in-process ASGI transport buffers whole bodies)
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=0, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    await app_module.ready.wait()
+    print("startup: " + "  ".join(f"{k}_s={v:.3f}" for k, v in app_module.startup.items()))
+
+    upload = fake_upload()
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None, limits=limits) as client:
+            results = []
+            for scenario in args.scenarios:
+                result = await run_scenario(client, scenario, args, upload)
+                results.append(result)
+                line = "  ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in result.items())
+                print(line)
+    finally:
+        server.should_exit = True
+        await serving
+    return results
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), type=lambda s: [x for x in s.split(",") if x],
+                        help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=40, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", default="0.8:2.0", help="Gemini median:p95 seconds")
+    parser.add_argument("--tts-latency", default="0.4:1.0", help="ElevenLabs time-to-first-byte median:p95 seconds")
+    parser.add_argument("--stt-latency", default="0.5:1.2", help="speech recognition median:p95 seconds")
+    parser.add_argument("--audio-format", default="mp3", choices=("mp3", "ogg", "wav"))
+    parser.add_argument("--shared-session", action="store_true", help="send every request to one session; each new message cancels the debates still running there, so chat/stream/audio results measure superseded, truncated runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file for comparison between commits")
+    return parser
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    random.seed(args.seed)
+
+    # Keep benchmark artifacts and cache out of the real ones
+    scratch = tempfile.mkdtemp(prefix="duck-bench-")
+    os.environ.setdefault("TTS_CACHE_DIR", os.path.join(scratch, "tts"))
+    os.environ.setdefault("AUDIO_STORE_DIR", os.path.join(scratch, "audio"))
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    os.environ.setdefault("ELEVENLABS_API_KEY", "bench")
+    # Fakes stand in for the providers, so there is nothing to preconnect to
+    os.environ.setdefault("WARMUP", "0")
+
+    results = asyncio.run(main(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results, "timestamp": time.time()}, f, indent=2)
@@ -1,24 +1,129 @@
 import os
-import google.generativeai as genai
+import json
+import asyncio
+from functools import lru_cache
 from dotenv import load_dotenv
+from metrics import span
+from scheduler import scheduler
 
 load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 MODEL_ID = "gemini-2.5-flash"
 
-def generate_reply(character, history: str) -> str:
-    """
-    Generates a reply for a specific character based on the conversation history.
-    """
-    sys = (
+@lru_cache(maxsize=1)
+def _genai():
+    # The SDK (and grpc under it) is slow to import; pay for it on first use or in warmup
+    import google.generativeai as genai
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai
+
+def _system_instruction(character) -> str:
+    return (
         f"You are {character['name']}. {character['prompt']} "
         f"Speak in a {character['style']} tone. "
         "Keep your response short (under 2 sentences). "
         "React to the previous messages in the conversation history."
     )
-    
-    model = genai.GenerativeModel(MODEL_ID, system_instruction=sys)
-    
+
+@lru_cache(maxsize=32)
+def _model(system_instruction: str):
+    # One model per character, reused across requests instead of rebuilt per turn
+    return _genai().GenerativeModel(MODEL_ID, system_instruction=system_instruction)
+
+def _prompt(history: str) -> str:
     # We pass the conversation history as the user prompt to contextually generate the next line
-    response = model.generate_content(f"Here is the conversation so far:\n\n{history}\n\nYour turn to speak:")
+    return f"Here is the conversation so far:\n\n{history}\n\nYour turn to speak:"
+
+async def generate_reply_async(character, history: str) -> str:
+    """
+    Generates a reply for a specific character based on the conversation
+    history, without blocking the event loop.
+    """
+    model = _model(_system_instruction(character))
+
+    async def call():
+        with span("gemini.reply"):
+            return await model.generate_content_async(_prompt(history))
+
+    response = await scheduler.run("gemini", call)
     return response.text.strip()
+
+SUMMARY_INSTRUCTION = (
+    "You maintain the running memory of a group chat between a user and five ducks. "
+    "Merge the new lines into the existing summary. Keep who said what when it matters, "
+    "the user's topics and feelings, and any running jokes. "
+    "Reply with the updated summary only, in under 120 words."
+)
+
+async def summarize_async(summary: str, lines: list[str]) -> str:
+    """
+    Folds older conversation lines into the running summary.
+    """
+    model = _model(SUMMARY_INSTRUCTION)
+
+    async def call():
+        with span("gemini.summary"):
+            return await model.generate_content_async(
+                f"Existing summary:\n{summary or '(none)'}\n\nNew lines:\n" + "\n".join(lines)
+            )
+
+    response = await scheduler.run("gemini", call)
+    return response.text.strip()
+
+SCRIPT_INSTRUCTION = (
+    "You write short group-chat scripts for five duck characters reacting to a user. "
+    "Each line is under 2 sentences, in that duck's voice and tone, and reacts to the conversation so far. "
+    "Reply with JSON only: a list of objects with keys \"speaker\", \"text\" and \"mood\", "
+    "where mood is one emoji for how that duck feels."
+)
+
+def _script_prompt(speakers, history: str) -> str:
+    cast = {c["name"]: c for c in speakers}
+    cast_text = "\n".join(f"- {c['name']}: {c['prompt']} Tone: {c['style']}." for c in cast.values())
+    order = ", ".join(c["name"] for c in speakers)
+    return (
+        f"The ducks:\n{cast_text}\n\n"
+        f"Here is the conversation so far:\n\n{history}\n\n"
+        f"Write the next {len(speakers)} lines, spoken in exactly this order: {order}."
+    )
+
+async def generate_script_async(speakers, history: str) -> list[dict]:
+    """
+    Writes a whole multi-turn exchange in one call. `speakers` fixes who talks
+    in which order; returns one {"speaker", "text", "mood"} dict per speaker.
+    Raises ValueError if the reply does not match that order.
+    """
+    model = _model(SCRIPT_INSTRUCTION)
+
+    async def call():
+        with span("gemini.script"):
+            return await model.generate_content_async(
+                _script_prompt(speakers, history),
+                generation_config=_genai().GenerationConfig(response_mime_type="application/json"),
+            )
+
+    response = await scheduler.run("gemini", call)
+    lines = json.loads(response.text)
+    if not isinstance(lines, list) or len(lines) < len(speakers):
+        raise ValueError(f"Script has {len(lines) if isinstance(lines, list) else 0} lines, expected {len(speakers)}")
+    script = []
+    for speaker, line in zip(speakers, lines):
+        if not isinstance(line, dict) or line.get("speaker") != speaker["name"] or not str(line.get("text", "")).strip():
+            raise ValueError(f"Script line {line!r} does not match speaker {speaker['name']}")
+        script.append({"speaker": speaker["name"], "text": str(line["text"]).strip(), "mood": str(line.get("mood", "")).strip()})
+    return script
+
+async def warmup(characters):
+    """
+    Imports the SDK and builds every model we will call, then makes one cheap
+    request so the first real reply does not pay for connection setup.
+    """
+    def build_models():
+        for character in characters:
+            _model(_system_instruction(character))
+        for instruction in (SUMMARY_INSTRUCTION, SCRIPT_INSTRUCTION):
+            _model(instruction)
+
+    with span("warmup.gemini"):
+        # Off the event loop: the SDK import alone takes about a second
+        await asyncio.to_thread(build_models)
+        await _model(SUMMARY_INSTRUCTION).count_tokens_async("warmup")
@@ -0,0 +1,24 @@
+import time
+from collections import OrderedDict
+
+def evict_lru(entries: OrderedDict, max_entries: int, idle_ttl: float, busy, keep=None) -> list:
+    """
+    Removes entries past `max_entries` (least recently used first) and those
+    idle longer than `idle_ttl` seconds. `entries` must be kept in use order
+    (move_to_end on access) and its values need a monotonic `last_used`.
+    Entries where `busy(value)` is true, and `keep`, are skipped.
+    Returns the removed (key, value) pairs.
+    """
+    now = time.monotonic()
+    evicted = []
+    for key, value in list(entries.items()):
+        over_cap = len(entries) > max_entries
+        idle = now - value.last_used > idle_ttl
+        if not (over_cap or idle):
+            # Ordered oldest-first, so nothing after this is idle either
+            break
+        if key == keep or busy(value):
+            continue
+        del entries[key]
+        evicted.append((key, value))
+    return evicted
@@ -1,13 +1,74 @@
-from fastapi import FastAPI, HTTPException, UploadFile, Form, File
+from time import perf_counter
+IMPORT_STARTED = perf_counter()
+from fastapi import FastAPI, HTTPException, UploadFile, Form, File, Request, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, FileResponse, Response, PlainTextResponse, JSONResponse
+from contextlib import asynccontextmanager, suppress
 from pydantic import BaseModel
-from orchestrator import run_debate, reset_history, run_single_turn
+from orchestrator import run_debate, reset_history, run_single_turn, stream_debate, bundle_debate, wants_bundle, audio_store, DEBATE_MODES, CHARACTERS
 import os
+import json
 import random
-from stt import stt
+import asyncio
+import stt
+import llm_gemini
+import tts_eleven
+from stt import stt_async, SpeechIngest, STT_SAMPLE_RATE
+from tts_eleven import negotiate_audio_format
+from vitals import VitalsStore
+import metrics
 
-app = FastAPI()
+# Set WARMUP=0 to skip provider preconnects (offline dev, benchmarks)
+WARMUP = os.getenv("WARMUP", "1") == "1"
+# Upper bound per provider; a slow or down provider must not hold readiness hostage
+WARMUP_TIMEOUT_S = float(os.getenv("WARMUP_TIMEOUT_S", "10"))
+
+# Cold-start timings in seconds, exposed on /ready and /metrics
+startup = {"import": perf_counter() - IMPORT_STARTED}
+warmup_results = {}
+ready = asyncio.Event()
+
+async def warmup():
+    """
+    Pays the one-off costs (SDK imports, client construction, TLS handshakes,
+    ffmpeg setup) before traffic arrives, then marks the app ready.
+    """
+    started = perf_counter()
+    if WARMUP:
+        steps = {
+            "gemini": llm_gemini.warmup(CHARACTERS),
+            "elevenlabs": tts_eleven.warmup(),
+            "stt": stt.warmup(),
+        }
+        results = await asyncio.gather(
+            *(asyncio.wait_for(step, WARMUP_TIMEOUT_S) for step in steps.values()),
+            return_exceptions=True,
+        )
+        for name, result in zip(steps, results):
+            # Failures are reported, not fatal: the first real request retries
+            warmup_results[name] = "ok" if not isinstance(result, BaseException) else f"error: {result!r}"
+            if isinstance(result, BaseException):
+                print(f"Warmup of {name} failed: {result!r}")
+    startup["warmup"] = perf_counter() - started
+    startup["ready"] = perf_counter() - IMPORT_STARTED
+    ready.set()
+    print(f"Ready in {startup['ready']:.2f}s (import {startup['import']:.2f}s, warmup {startup['warmup']:.2f}s)")
+
+metrics.register_collector("duck_startup_seconds", "Cold-start time by phase, counted from importing main", "phase", lambda: dict(startup))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    sweeper = asyncio.create_task(audio_store.sweep_forever())
+    vitals_poller = asyncio.create_task(vitals_store.poll_forever())
+    # In the background so the server accepts connections (and answers /ready) meanwhile
+    warming = asyncio.create_task(warmup())
+    yield
+    warming.cancel()
+    vitals_poller.cancel()
+    sweeper.cancel()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -16,109 +77,277 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
+# Request IDs + per-route latency; stage timings come from metrics.span
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Legacy audio URLs from before the artifact store
 os.makedirs("static", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# In-memory storage for vitals
-# Default values
-latest_vitals = {
-    'timestamp_s': 0, 
-    'breathing_rate_rpm': 0, 
-    'heart_rate_bpm': 0
-}
+# Artifacts never change once written, so clients may cache them for good
+AUDIO_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Per-session vitals ring buffers (smoothed, with mood hysteresis)
+vitals_store = VitalsStore()
 
 class ChatRequest(BaseModel):
     message: str
     user_name: str = "User" 
     mode: str = "chat" # "chat" or "debug"
+    session_id: str = "default"
+    audio_format: str | None = None # "mp3", "ogg" or "wav"; negotiated from Accept if unset
+    debate_mode: str | None = None # "turns" or "script"; DEBATE_MODE if unset
+    stream_audio: bool | None = None # MP3 only: audio URLs stream while synthesizing; STREAM_AUDIO if unset
+    bundle: bool | None = None # also return the whole debate as one file (not on /chat/stream); BUNDLE_AUDIO if unset
 
 class DuckChatRequest(BaseModel):
     duck_id: int
     user_name: str = "User"
+    session_id: str = "default"
+    audio_format: str | None = None
+    stream_audio: bool | None = None
+
+def pick_audio_format(requested: str | None, http_request: Request) -> str:
+    try:
+        return negotiate_audio_format(requested, http_request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def check_debate_mode(debate_mode: str | None):
+    if debate_mode and debate_mode not in DEBATE_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported debate mode: {debate_mode}")
 
 @app.post("/chat")
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, http_request: Request):
     """
     Continues the conversation (group debate).
     The backend maintains memory of previous turns.
     """
+    audio_format = pick_audio_format(request.audio_format, http_request)
+    check_debate_mode(request.debate_mode)
     try:
-        # Inject vitals context if they are recent/relevant? 
-        # For now just standard chat, but we could append vitals to history if we wanted ducks to react to it.
         print(f"Request: mode={request.mode}, user={request.user_name}, msg={request.message}")
-        speeches = run_debate(request.message, request.user_name, turns=int(5*random.random())+1, mode=request.mode)
+        # A bundle needs every line's finished audio, so it turns streaming off
+        bundle = wants_bundle(request.bundle)
+        speeches = await run_debate(request.message, request.user_name, turns=int(5*random.random())+1, mode=request.mode, session_id=request.session_id, audio_format=audio_format,
+                                    vitals_state=vitals_store.get(request.session_id).fresh_state(),
+                                    debate_mode=request.debate_mode, stream_audio=False if bundle else request.stream_audio)
+        if bundle:
+            return {"speeches": speeches, "bundle": await bundle_debate(speeches, request.session_id, audio_format)}
         return {"speeches": speeches}
     except Exception as e:
         print(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request):
+    """
+    Same as /chat, but streams each speech as a server-sent event the moment
+    its audio is ready, followed by a final `done` event.
+    """
+    audio_format = pick_audio_format(request.audio_format, http_request)
+    check_debate_mode(request.debate_mode)
+    print(f"Stream request: mode={request.mode}, user={request.user_name}, msg={request.message}")
+    turns = int(5*random.random())+1
+
+    async def events():
+        try:
+            async for speech in stream_debate(request.message, request.user_name, turns=turns, mode=request.mode, session_id=request.session_id, audio_format=audio_format,
+                                                  vitals_state=vitals_store.get(request.session_id).fresh_state(),
+                                                  debate_mode=request.debate_mode, stream_audio=request.stream_audio):
+                yield f"event: speech\ndata: {json.dumps(speech)}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            print(f"Error in chat stream endpoint: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.post("/chat-audio")
 async def chat_audio_endpoint(
+    http_request: Request,
     audio: UploadFile = File(...),
     user_name: str = Form(...),
     mode: str = Form(...),
     turns: int = Form(...),
+    session_id: str = Form("default"),
+    audio_format: str | None = Form(None),
+    debate_mode: str | None = Form(None),
+    stream_audio: bool | None = Form(None),
+    bundle: bool | None = Form(None),
 ):
+    audio_format = pick_audio_format(audio_format, http_request)
+    check_debate_mode(debate_mode)
     try:
-        message = stt(audio)
+        message = await stt_async(audio)
         print(f"Transcription: {message}")
-        speeches = run_debate(user_message=message, user_name=user_name, turns=int(5*random.random())+1, mode=mode)
-        print(speeches)
+        bundle = wants_bundle(bundle)
+        speeches = await run_debate(user_message=message, user_name=user_name, turns=int(5*random.random())+1, mode=mode, session_id=session_id, audio_format=audio_format,
+                                    vitals_state=vitals_store.get(session_id).fresh_state(),
+                                    debate_mode=debate_mode, stream_audio=False if bundle else stream_audio)
+        if bundle:
+            return {"speeches": speeches, "transcription": message, "bundle": await bundle_debate(speeches, session_id, audio_format)}
         return {"speeches": speeches, "transcription": message}
     except Exception as e:
         print(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.websocket("/ws/chat-audio")
+async def chat_audio_ws(websocket: WebSocket):
+    """
+    Live version of /chat-audio. The client sends one JSON config message
+    (user_name, mode, session_id, audio_format, debate_mode, stream_audio,
+    encoding "webm" or "pcm16", sample_rate for pcm16), then binary audio
+    chunks while recording, optionally ending with {"type": "stop"}.
+    The server sends {"type": "endpoint"} as soon as it hears the user stop,
+    then "transcription", one "speech" per line as in /chat/stream, and "done".
+    """
+    await websocket.accept()
+    ingest = None
+    receiving = None
+    try:
+        config = await websocket.receive_json()
+        audio_format = negotiate_audio_format(config.get("audio_format"))
+        debate_mode = config.get("debate_mode")
+        if debate_mode and debate_mode not in DEBATE_MODES:
+            raise ValueError(f"Unsupported debate mode: {debate_mode}")
+        session_id = config.get("session_id", "default")
+        ingest = SpeechIngest(config.get("encoding", "webm"), int(config.get("sample_rate", STT_SAMPLE_RATE)))
+        await ingest.start()
+
+        async def receive_audio():
+            # Keeps reading after the endpoint so late chunks are drained and a disconnect is noticed
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+                if message.get("bytes"):
+                    await ingest.feed(message["bytes"])
+                elif message.get("text") and json.loads(message["text"]).get("type") == "stop":
+                    await ingest.finish()
+
+        receiving = asyncio.create_task(receive_audio())
+        ended = asyncio.create_task(ingest.ended.wait())
+        await asyncio.wait({receiving, ended}, return_when=asyncio.FIRST_COMPLETED)
+        ended.cancel()
+        if receiving.done():
+            receiving.result()
+        await websocket.send_json({"type": "endpoint"})
+
+        message = await ingest.transcribe()
+        print(f"Transcription: {message}")
+        await websocket.send_json({"type": "transcription", "text": message})
+        if message:
+            async for speech in stream_debate(message, config.get("user_name", "User"), turns=int(5*random.random())+1, mode=config.get("mode", "chat"),
+                                              session_id=session_id, audio_format=audio_format,
+                                              vitals_state=vitals_store.get(session_id).fresh_state(),
+                                              debate_mode=debate_mode, stream_audio=config.get("stream_audio")):
+                await websocket.send_json({"type": "speech", "speech": speech})
+        await websocket.send_json({"type": "done"})
+        await websocket.close()
+    except WebSocketDisconnect:
+        print("Audio websocket disconnected")
+    except Exception as e:
+        print(f"Error in audio websocket: {e}")
+        # The client may already be gone
+        with suppress(Exception):
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            await websocket.close(code=1011)
+    finally:
+        if receiving:
+            receiving.cancel()
+        if ingest:
+            ingest.close()
+
 @app.post("/chat/duck")
-async def duck_chat_endpoint(request: DuckChatRequest):
+async def duck_chat_endpoint(request: DuckChatRequest, http_request: Request):
     """
     Triggers a specific duck to speak based on the current context.
     """
+    audio_format = pick_audio_format(request.audio_format, http_request)
     try:
         print(f"Single duck request: duck_id={request.duck_id}, user={request.user_name}")
-        speeches = run_single_turn(request.duck_id, request.user_name)
+        speeches = await run_single_turn(request.duck_id, request.user_name, session_id=request.session_id, audio_format=audio_format, stream_audio=request.stream_audio)
         return {"speeches": speeches}
     except Exception as e:
         print(f"Error in duck chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/audio/{filename}")
+async def audio_endpoint(filename: str, http_request: Request):
+    """
+    Serves generated audio with a strong ETag, long-lived caching and range support.
+    A line still being synthesized is relayed chunk by chunk as it arrives.
+    """
+    live = audio_store.live(filename.split(".")[0])
+    if live and live.artifact.filename == filename:
+        # Length unknown yet, so chunked and not cacheable; later requests get the file
+        return StreamingResponse(live.iter_chunks(), media_type=live.artifact.media_type, headers={"Cache-Control": "no-store"})
+    # Streaming in on another worker: serve the whole file once it lands
+    artifact = await audio_store.wait_committed(filename.split(".")[0])
+    if not artifact or artifact.filename != filename or not artifact.path.exists():
+        raise HTTPException(status_code=404, detail="Audio not found")
+    etag = f'"{artifact.id}"'
+    headers = {"ETag": etag, "Cache-Control": AUDIO_CACHE_CONTROL}
+    if etag in http_request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(artifact.path, media_type=artifact.media_type, headers=headers)
+
 @app.post("/vitals")
-async def vitals_endpoint(request: dict):
-    global latest_vitals
+async def vitals_endpoint(request: dict, session_id: str = "default"):
     print(f"vitals update: {request}")
-    latest_vitals = request
+    vitals_store.add(request.get("session_id", session_id), request)
     return {"status": "Vitals updated."}
 
 @app.get("/vitals")
-async def get_vitals():
-    if not latest_vitals:
-        return {
-            "timestamp_s": None,
-            "heart_rate_bpm": None,
-            "breathing_rate_rpm": None,
-            "mood": None,
-            "mood_context": "No vitals data available"
-        }
-    
-    from orchestrator import analyze_vitals_state
-    vitals_state = analyze_vitals_state(latest_vitals)
-    
-    return {
-        **latest_vitals, 
-        "mood": vitals_state["state"],
-        "mood_context": vitals_state.get("vitals_context", ""),
-        "excluded_ducks": vitals_state.get("excluded_characters", []),
-        "preferred_ducks": vitals_state.get("preferred_characters", [])
-    }
+async def get_vitals(session_id: str = "default"):
+    return vitals_store.get(session_id).payload
+
+@app.get("/vitals/stream")
+async def vitals_stream_endpoint(http_request: Request, session_id: str = "default"):
+    """
+    Pushes the smoothed vitals payload as a server-sent event whenever a new
+    sample arrives, instead of clients polling GET /vitals.
+    """
+    buffer = vitals_store.get(session_id)
+
+    async def events():
+        queue = buffer.subscribe()
+        try:
+            while not await http_request.is_disconnected():
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: vitals\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            buffer.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of stage latencies, errors and counters."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/reset")
-async def reset_endpoint():
-    """Clears conversation memory."""
-    reset_history()
+async def reset_endpoint(session_id: str = "default"):
+    """Clears conversation memory for one session."""
+    reset_history(session_id)
     return {"status": "Memory wiped. The ducks have forgotten everything."}
 
+@app.get("/ready")
+def readiness():
+    """503 until startup warmup has finished; for load balancers and orchestrators."""
+    body = {"ready": ready.is_set(), "startup_s": {k: round(v, 3) for k, v in startup.items()}, "warmup": warmup_results}
+    if not ready.is_set():
+        return JSONResponse(body, status_code=503)
+    return body
+
 @app.get("/")
 def root():
     return {"status": "The Quack Council is in session."}
@@ -0,0 +1,175 @@
+import asyncio
+from llm_gemini import summarize_async
+from scheduler import priority_var, BACKGROUND
+
+# Rough token budget for the history part of every Gemini prompt
+TOKEN_BUDGET = 1500
+# Once verbatim lines pass the budget, fold the oldest until they fit this
+FOLD_TARGET = 1000
+# Hard ceiling while a fold is still running; oldest pending lines are dropped past it
+HARD_LIMIT = 2500
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting English chat
+    return len(text) // 4 + 1
+
+class ConversationMemory:
+    """
+    Rolling conversation memory: recent lines verbatim, older lines folded
+    into a summary by a background Gemini call so prompts stay within budget.
+    """
+
+    def __init__(self, budget: int = TOKEN_BUDGET, fold_target: int = FOLD_TARGET, hard_limit: int = HARD_LIMIT):
+        self.budget = budget
+        self.fold_target = fold_target
+        self.hard_limit = hard_limit
+        self.summary = ""
+        self.lines = []
+        self._line_tokens = []
+        self._tokens = 0
+        self._folding = 0  # leading lines currently being summarized
+        self._fold_task = None
+        self._prompt = None
+        # Bumped on every content change so derived work (e.g. speculation) can detect staleness
+        self.version = 0
+        # Lines appended since the last save, replayed if another worker saved first
+        self.unsaved = []
+        # Called after a fold lands so the shorter history gets stored
+        self.on_fold = None
+
+    def __len__(self):
+        return len(self.lines)
+
+    def append(self, line: str):
+        self.version += 1
+        self.unsaved.append(line)
+        self.lines.append(line)
+        tokens = estimate_tokens(line)
+        self._line_tokens.append(tokens)
+        self._tokens += tokens
+        if self._prompt is not None:
+            self._prompt += f"\n{line}"
+        self._compact()
+
+    def retract(self, lines: list[str]):
+        """
+        Removes the most recent occurrence of each of `lines` that is still
+        verbatim, e.g. turns that were generated but never delivered.
+        Lines already being folded into the summary stay.
+        """
+        for line in reversed(lines):
+            for i in range(len(self.lines) - 1, self._folding - 1, -1):
+                if self.lines[i] == line:
+                    del self.lines[i]
+                    self._tokens -= self._line_tokens.pop(i)
+                    break
+            if line in self.unsaved:
+                del self.unsaved[len(self.unsaved) - 1 - self.unsaved[::-1].index(line)]
+        self._prompt = None
+        self.version += 1
+
+    def prompt(self) -> str:
+        """
+        History text for the next Gemini call. Cached and extended in place on
+        append; only rebuilt after a fold.
+        """
+        if self._prompt is None:
+            parts = ["CONVERSATION HISTORY:"]
+            if self.summary:
+                parts.append(f"SUMMARY OF EARLIER CONVERSATION: {self.summary}")
+            parts.extend(self.lines)
+            self._prompt = "\n".join(parts)
+        return self._prompt
+
+    def clear(self):
+        self.cancel_fold()
+        version, on_fold = self.version, self.on_fold
+        self.__init__(self.budget, self.fold_target, self.hard_limit)
+        self.version = version + 1
+        self.on_fold = on_fold
+
+    def cancel_fold(self):
+        if self._fold_task:
+            self._fold_task.cancel()
+            self._fold_task = None
+            self._folding = 0
+
+    def _drop_oldest(self, count: int):
+        self._tokens -= sum(self._line_tokens[:count])
+        del self.lines[:count]
+        del self._line_tokens[:count]
+        self._prompt = None
+
+    def _compact(self):
+        # Never silently grow without bound, even if summaries keep failing
+        while self._tokens > self.hard_limit and len(self.lines) > 1:
+            self._drop_oldest(1)
+            self._folding = max(0, self._folding - 1)
+
+        if self._tokens <= self.budget or self._fold_task is not None:
+            return
+
+        # Pick the oldest lines until what remains fits the fold target
+        count, remaining = 0, self._tokens
+        while remaining > self.fold_target and count < len(self.lines) - 1:
+            remaining -= self._line_tokens[count]
+            count += 1
+        if not count:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts): just drop instead of summarizing
+            self._drop_oldest(count)
+            return
+
+        self._folding = count
+        self._fold_task = loop.create_task(self._fold(list(self.lines[:count])))
+
+    async def _fold(self, lines):
+        priority_var.set(BACKGROUND)
+        try:
+            summary = await summarize_async(self.summary, lines)
+        except Exception as e:
+            print(f"Error summarizing history: {e}")
+            summary = None
+        self._fold_task = None
+        if summary is None:
+            # Lines stay verbatim; the next append retries the fold
+            self._folding = 0
+            return
+        # Lines stayed in the prompt verbatim until the summary could replace them
+        self.summary = summary
+        self._drop_oldest(self._folding)
+        self._folding = 0
+        self._compact()
+        if self.on_fold:
+            self.on_fold()
+
+    def snapshot(self) -> dict:
+        return {"summary": self.summary, "lines": list(self.lines), "version": self.version}
+
+    def load(self, data: dict, replay: list[str] = ()):
+        """
+        Replaces the contents in place with a stored snapshot, then appends
+        `replay` on top. Callers holding this object keep seeing the result.
+        """
+        self.cancel_fold()
+        self.summary = data.get("summary", "")
+        self.lines = list(data.get("lines", []))
+        self._line_tokens = [estimate_tokens(line) for line in self.lines]
+        self._tokens = sum(self._line_tokens)
+        self._prompt = None
+        self.unsaved = []
+        # Keeps version-tagged work (speculation) valid across workers and reloads
+        self.version = data.get("version", self.version + 1)
+        for line in replay:
+            self.append(line)
+
+    @classmethod
+    def from_snapshot(cls, data: dict) -> "ConversationMemory":
+        # Restored as stored: compacting here would start a fold on every reload
+        memory = cls()
+        memory.load(data)
+        return memory
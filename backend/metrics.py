@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Print one JSON line per finished span (stage timings with request IDs)
+TRACE_SPANS = os.getenv("TRACE_SPANS", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Set per HTTP request by MetricsMiddleware; copied into tasks and worker threads
+request_id_var = ContextVar("request_id", default="-")
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, values)} {value}")
+        return lines
+
+class Gauge(Counter):
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _format_labels(self.labels + ("le",), values + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels + ("le",), values + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {series[-1]}")
+        return lines
+
+STAGE_SECONDS = Histogram("duck_stage_seconds", "Latency of pipeline stages and provider calls", ("stage",))
+STAGE_ERRORS = Counter("duck_stage_errors_total", "Failed pipeline stages and provider calls", ("stage",))
+STAGE_INFLIGHT = Gauge("duck_stage_inflight", "Pipeline stages currently running", ("stage",))
+HTTP_SECONDS = Histogram("duck_http_request_seconds", "HTTP request latency until the response is fully sent", ("method", "route", "status"))
+
+_metrics = [STAGE_SECONDS, STAGE_ERRORS, STAGE_INFLIGHT, HTTP_SECONDS]
+# name -> callable returning {label value: number}; sampled on every scrape
+_collectors = {}
+
+def register_collector(name: str, help: str, label: str, collect):
+    """
+    Exposes numbers owned by another module (cache counters, queue sizes)
+    as a gauge family read at scrape time.
+    """
+    _collectors[name] = (help, label, collect)
+
+@contextmanager
+def span(stage: str):
+    """
+    Times a stage into duck_stage_seconds; errors are counted and re-raised.
+    Works around sync code and around awaits.
+    """
+    STAGE_INFLIGHT.inc(stage)
+    start = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        STAGE_ERRORS.inc(stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_INFLIGHT.dec(stage)
+        STAGE_SECONDS.observe(elapsed, stage)
+        if TRACE_SPANS:
+            print(json.dumps({"request_id": request_id_var.get(), "stage": stage, "ms": round(elapsed * 1000, 1), "ok": ok}))
+
+def observe(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage)
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for name, (help, label, collect) in _collectors.items():
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+        try:
+            for key, value in collect().items():
+                lines.append(f"{name}{_format_labels((label,), (key,))} {value}")
+        except Exception as e:
+            print(f"Error collecting {name}: {e}")
+    return "\n".join(lines) + "\n"
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: assigns a request ID (or reuses X-Request-ID), echoes it
+    in the response, and records per-route latency.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode() or uuid.uuid4().hex[:16]
+        token = request_id_var.set(request_id)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            route = scope.get("route")
+            HTTP_SECONDS.observe(time.perf_counter() - start, scope["method"], getattr(route, "path", "unmatched"), status)
+            request_id_var.reset(token)
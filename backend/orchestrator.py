@@ -1,17 +1,125 @@
+import os
 import json
-import time
 import random
+import asyncio
+from time import perf_counter
+from contextlib import contextmanager
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from llm_gemini import generate_reply
-from tts_eleven import tts_to_wav
+from llm_gemini import generate_reply_async, generate_script_async
+from tts_eleven import tts_to_file_async, tts_stream_to_file_async, stitch_to_file_async, AUDIO_FORMATS, DEFAULT_AUDIO_FORMAT
+from sessions import default_store
+from audio_store import AudioStore
+from speculation import Speculator
+from metrics import span, observe, register_collector, request_id_var
+from scheduler import priority_var, INTERACTIVE
 
-# Load characters once
-CHARACTERS = json.loads(Path("characters.json").read_text())
+# "turns": one Gemini call per turn; "script": the whole exchange in one call
+DEBATE_MODE = os.getenv("DEBATE_MODE", "turns")
+DEBATE_MODES = ("turns", "script")
 
-# In-memory storage for conversation history per session/user (simplified for hackathon)
-# key: "default" (or user_id), value: list of strings (history)
-conversations = {}
+# Hand out audio URLs before synthesis finishes and relay MP3 chunks as they arrive
+STREAM_AUDIO = os.getenv("STREAM_AUDIO", "0") == "1"
+
+# Also stitch each finished /chat debate into one file with a turn timeline
+BUNDLE_AUDIO = os.getenv("BUNDLE_AUDIO", "0") == "1"
+BUNDLE_PAUSE_MS = int(os.getenv("BUNDLE_PAUSE_MS", "400"))
+
+# Load characters once, from next to this file rather than the working directory
+CHARACTERS_PATH = Path(__file__).parent / "characters.json"
+CHARACTERS = json.loads(CHARACTERS_PATH.read_text())
+
+# Conversation history per session, LRU/TTL-evicted (optionally persisted to SQLite)
+sessions = default_store()
+
+# Generated audio, served by the /audio route and swept by TTL / quota
+audio_store = AudioStore()
+
+# Optional pre-generated poke replies (SPECULATIVE_POKES=1)
+speculator = Speculator(audio_store)
+
+# Streaming syntheses still running; referenced so they are not garbage-collected
+_relays = set()
+
+class TurnQueue:
+    """
+    Generation work in flight for one session in this worker. History
+    mutations are serialized by `session.lock` (FIFO); this tracks the LLM
+    and TTS tasks behind them so a newer user message can cancel whatever it
+    made obsolete, and so duplicate pokes share a single reply.
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        # Bumped by every user message; work started under an older generation is stale
+        self.generation = 0
+        self.tasks = set()
+        # (duck_id, audio_format, stream_audio) -> task producing that poke's reply
+        self.pokes = {}
+        # Called on supersede, before any task is cancelled, to take back lines nobody heard
+        self.rollbacks = set()
+        # Requests currently using this queue
+        self.users = 0
+
+    def spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self.track(task)
+        return task
+
+    def track(self, task: asyncio.Task):
+        self.tasks.add(task)
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task):
+        self.tasks.discard(task)
+        self.prune()
+
+    def supersede(self) -> int:
+        """Cancels all tracked work and returns the new generation."""
+        self.generation += 1
+        rollbacks, self.rollbacks = self.rollbacks, set()
+        for rollback in rollbacks:
+            rollback()
+        cancelled = 0
+        for task in list(self.tasks):
+            cancelled += task.cancel()
+        self.pokes.clear()
+        if cancelled:
+            turn_queue_counts["cancelled"] += cancelled
+            print(f"[{request_id_var.get()}] cancelled {cancelled} stale task(s) for session {self.session_id}")
+        return self.generation
+
+    def prune(self):
+        if not self.users and not self.tasks and _queues.get(self.session_id) is self:
+            del _queues[self.session_id]
+
+# session_id -> TurnQueue, only while that session has work in flight
+_queues = {}
+turn_queue_counts = {"cancelled": 0, "coalesced": 0}
+
+def _retract(session_id: str, lines: list[str]):
+    # Keeps the history to what the user actually got
+    session = sessions.get(session_id)
+    session.memory.retract(lines)
+    sessions.save(session)
+
+@contextmanager
+def _turn_queue(session_id: str):
+    queue = _queues.get(session_id)
+    if queue is None:
+        queue = _queues[session_id] = TurnQueue(session_id)
+    queue.users += 1
+    try:
+        yield queue
+    finally:
+        queue.users -= 1
+        queue.prune()
+
+register_collector("duck_sessions", "Conversation sessions held in memory", "kind", lambda: {"active": len(sessions)})
+register_collector("duck_audio_store", "Generated audio on disk", "field", lambda: {"bytes": audio_store.total_bytes()})
+register_collector("duck_speculation", "Speculative poke replies", "field", speculator.stats)
+register_collector("duck_turn_queue", "Superseded generation work and coalesced pokes", "field", lambda: dict(turn_queue_counts))
+
+NAME_TO_ID = {"Gordon": 1, "Joy": 2, "Blues": 3, "Dexter": 4, "Goose": 5}
 
 def get_character_by_name(name):
     return next((c for c in CHARACTERS if c["name"] == name), None)
@@ -52,145 +160,365 @@ def determine_mood(text: str, base_personality: str) -> str:
     # but better to return null and let frontend fallback.
     return "" 
 
-def run_debate(user_message: str, user_name: str = "User", turns: int = 3, mode: str = "chat", vitals = None):
+async def _prepare_debate(user_message: str, user_name: str, turns: int, mode: str, vitals, session_id: str = "default", vitals_state = None, debate_mode: str = None):
     """
-    Simulates a debate turn.
-    Returns a list of speech objects.
+    Generates the debate text, yielding each turn as soon as its text exists
+    so TTS can start while the next turn is written. In script mode all turns
+    come from a single Gemini call.
     """
-    
-    print(f"starting run_debate with params: {user_message}", {user_name}, {turns}, {mode})
-    ts = time.strftime("%Y%m%d-%H%M%S")
-    static_dir = Path("static/audio") / ts
-    static_dir.mkdir(parents=True, exist_ok=True)
-
-    vitals_state = analyze_vitals_state(vitals)
+    debate_mode = debate_mode or DEBATE_MODE
+    if vitals_state is None:
+        vitals_state = analyze_vitals_state(vitals)
     print(f"Vitals state: {vitals_state['state']}")
 
-    # Initialize History
-    session_id = "default" 
-    if session_id not in conversations:
-        conversations[session_id] = []
-    history = conversations[session_id]
-    
-    # Add User Message
-    if mode == "chat":
-        history.append(f"{user_name}: {user_message}")
-    else:
-        history.append(f"SYSTEM: The topic is now: {user_message}")
-
-    if len(history) > 50:
-        history = history[-50:]
-
-    if vitals:
-        history.append(f"SYSTEM: {vitals_state['vitals_context']}")
+    session = sessions.get(session_id)
+    async with session.lock:
+        sessions.refresh(session)
+        history = session.memory
+        
+        # Add User Message
+        if mode == "chat":
+            history.append(f"{user_name}: {user_message}")
+        else:
+            history.append(f"SYSTEM: The topic is now: {user_message}")
 
-    history_text = "CONVERSATION HISTORY:\n" + "\n".join(history)
-    
-    conversation_log = []
-    name_to_id = {"Gordon": 1, "Joy": 2, "Blues": 3, "Dexter": 4, "Goose": 5}
+        if vitals_state.get("vitals_context"):
+            history.append(f"SYSTEM: {vitals_state['vitals_context']}")
 
-    current_speaker = select_next_speaker(
-        {"name": ""}, vitals_state 
-    )    
-    print(f"Processing message: {user_message} (Mode: {mode})")
+        # Speaker order is fixed up front so both modes respect the vitals constraints
+        speakers = []
+        current_speaker = {"name": ""}
+        for _ in range(turns):
+            current_speaker = select_next_speaker(current_speaker, vitals_state)
+            speakers.append(current_speaker)
+        print(f"Processing message: {user_message} (Mode: {mode}, Debate mode: {debate_mode})")
 
-    for i in range(turns):
-        text = generate_reply(current_speaker, history_text)
-        
-        line = f"{current_speaker['name']}: {text}"
-        history.append(line)
-        history_text += f"\n{line}"
-        
-        # Determine transient mood
-        mood = determine_mood(text, current_speaker["style"])
-
-        turn_data = {
-            "duckId": name_to_id.get(current_speaker["name"], 1),
-            "character": current_speaker,
-            "text": text,
-            "mood": mood,
-            "filename": f"{i}_{current_speaker['name']}.wav"
-        }
-        conversation_log.append(turn_data)
-        
-        current_speaker = select_next_speaker(current_speaker, vitals_state)
-    conversations[session_id] = history
-
-    # Generate Audio Parallel
-    final_output = []
-    with ThreadPoolExecutor(max_workers=3) as ex:
-        future_to_turn = {}
-        for turn in conversation_log:
-            out_path = static_dir / turn["filename"]
-            web_path = f"/static/audio/{ts}/{turn['filename']}"
-            
-            future = ex.submit(
-                tts_to_wav, 
-                turn["text"], 
-                turn["character"]["voice_id"], 
-                str(out_path)
-            )
-            future_to_turn[future] = {**turn, "audioUrl": web_path}
-
-        for future in as_completed(future_to_turn):
-            data = future_to_turn[future]
+        script = None
+        if debate_mode == "script":
             try:
-                future.result()
-                word_count = len(data["text"].split())
-                data["duration"] = max(2000, word_count * 400)
-                del data["character"] 
-                final_output.append(data)
+                script = await generate_script_async(speakers, history.prompt())
             except Exception as e:
-                print(f"Error generating audio: {e}")
+                print(f"Script mode failed, falling back to per-turn: {e}")
+
+        try:
+            for i, speaker in enumerate(speakers):
+                if script:
+                    text, mood = script[i]["text"], script[i]["mood"]
+                else:
+                    text, mood = await generate_reply_async(speaker, history.prompt()), ""
+                
+                history.append(f"{speaker['name']}: {text}")
+                
+                # Determine transient mood (script mode lets the LLM pick a single emoji)
+                if not mood or len(mood) > 4 or mood.isalnum():
+                    mood = determine_mood(text, speaker["style"])
 
-    final_output.sort(key=lambda x: int(Path(x["audioUrl"]).name.split('_')[0]))
-    return final_output
+                yield {
+                    "duckId": NAME_TO_ID.get(speaker["name"], 1),
+                    "character": speaker,
+                    "text": text,
+                    "mood": mood,
+                    "filename": f"{i}_{speaker['name']}"
+                }
+        finally:
+            sessions.save(session)
 
-def run_single_turn(duck_id: int, user_name: str = "User"):
+def _start_relay(text: str, voice_id: str, artifact, session_id: str):
+    """
+    Synthesizes into a live artifact in the background. Its URL can be
+    fetched right away: the /audio route relays chunks as they arrive, then
+    serves the finished file once committed. A newer message in the session
+    cancels it.
+    """
+    live = audio_store.open_live(artifact)
+    start = perf_counter()
+
+    def on_chunk(chunk: bytes):
+        if not live.chunks:
+            observe("tts.first_chunk", perf_counter() - start)
+        live.write(chunk)
+
+    async def relay():
+        failed = True
+        try:
+            with span("tts"):
+                await tts_stream_to_file_async(text, voice_id, str(artifact.path), on_chunk)
+            audio_store.commit(artifact)
+            failed = False
+        except Exception as e:
+            print(f"Error streaming audio: {e}")
+        finally:
+            if failed:
+                artifact.path.unlink(missing_ok=True)
+            audio_store.close_live(artifact.id, failed)
+
+    task = asyncio.create_task(relay())
+    _relays.add(task)
+    task.add_done_callback(_relays.discard)
+    with _turn_queue(session_id) as queue:
+        queue.track(task)
+
+def _streams_audio(stream_audio: bool | None, audio_format: str) -> bool:
+    # Only MP3 is relayed untouched; other formats need the whole line to transcode
+    return (STREAM_AUDIO if stream_audio is None else stream_audio) and audio_format == "mp3"
+
+async def _synthesize_turn(turn, session_id: str, audio_format: str = DEFAULT_AUDIO_FORMAT, stream_audio: bool = False):
+    """
+    Runs TTS for one turn and returns its speech object. If TTS still fails
+    after the scheduler's retries the line is returned without audio.
+    With `stream_audio` it returns at once with a URL that streams the line
+    as it is synthesized; `duration` is then an estimate and there is no envelope.
+    """
+    ext = AUDIO_FORMATS[audio_format][0]
+    artifact = audio_store.allocate(ext, session_id)
+    data = {**turn, "filename": f"{turn['filename']}.{ext}", "audioUrl": artifact.url}
+    if stream_audio:
+        _start_relay(data["text"], data["character"]["voice_id"], artifact, session_id)
+        data.update({"duration": _estimated_duration(data["text"]), "streaming": True})
+        del data["character"]
+        return data
+    try:
+        with span("tts"):
+            timing = await tts_to_file_async(data["text"], data["character"]["voice_id"], str(artifact.path), audio_format)
+        audio_store.commit(artifact)
+    except Exception as e:
+        print(f"Error generating audio: {e}")
+        artifact.path.unlink(missing_ok=True)
+        data.update(_text_only(data["text"]))
+        del data["character"]
+        return data
+    except BaseException:
+        # Cancelled (superseded): nothing will ever commit this file
+        artifact.path.unlink(missing_ok=True)
+        raise
+    data.update(timing)
+    del data["character"]
+    return data
+
+def wants_bundle(bundle: bool | None) -> bool:
+    return BUNDLE_AUDIO if bundle is None else bundle
+
+async def bundle_debate(speeches: list, session_id: str = "default", audio_format: str = DEFAULT_AUDIO_FORMAT) -> dict | None:
+    """
+    Stitches a finished (non-streaming) debate into one compressed file with
+    BUNDLE_PAUSE_MS between lines, so the client downloads once and plays
+    it gaplessly. WAV debates are bundled as MP3. Returns `audioUrl`,
+    `duration` and a `timeline` of each speech's `offset` and `duration`
+    in ms, in speech order. Lines without audio become silence of their
+    `duration`. The per-turn files stay available for replay.
+    Returns None if no line has audio or stitching fails.
+    """
+    parts = []
+    for speech in speeches:
+        artifact = audio_store.get(Path(speech["audioUrl"]).stem) if speech.get("audioUrl") else None
+        parts.append(artifact.path if artifact else speech["duration"])
+    if all(isinstance(part, int) for part in parts):
+        return None
+    bundle_format = "mp3" if audio_format == "wav" else audio_format
+    artifact = audio_store.allocate(AUDIO_FORMATS[bundle_format][0], session_id)
+    try:
+        info = await stitch_to_file_async(parts, str(artifact.path), bundle_format, BUNDLE_PAUSE_MS)
+        audio_store.commit(artifact)
+    except Exception as e:
+        print(f"Error bundling audio: {e}")
+        artifact.path.unlink(missing_ok=True)
+        return None
+    except BaseException:
+        artifact.path.unlink(missing_ok=True)
+        raise
+    return {"audioUrl": artifact.url, **info}
+
+def _estimated_duration(text: str) -> int:
+    # Roughly how long a line takes to say or read, in ms
+    return max(1500, 60 * len(text))
+
+def _text_only(text: str) -> dict:
+    # Keeps a line whose audio failed on screen for about as long as it takes to read
+    return {"audioUrl": None, "audioError": True, "duration": _estimated_duration(text)}
+
+async def stream_debate(user_message: str, user_name: str = "User", turns: int = 3, mode: str = "chat", vitals = None, session_id: str = "default", audio_format: str = DEFAULT_AUDIO_FORMAT, vitals_state = None, debate_mode: str = None, stream_audio: bool = None):
+    """
+    Same debate as `run_debate`, but yields each speech object as soon as its
+    audio is written. TTS for turn N runs while turn N+1's text is generated,
+    so the first duck is ready after roughly one LLM call plus one TTS call.
+    With `stream_audio` (MP3 only) speeches are yielded once their text exists.
+    A newer message in the same session cancels the rest of this debate;
+    the generator then ends early.
+    """
+    stream_audio = _streams_audio(stream_audio, audio_format)
+    print(f"[{request_id_var.get()}] starting stream_debate with params: {user_message}", {user_name}, {turns}, {mode})
+    with _turn_queue(session_id) as queue:
+        async for speech in _stream_debate(queue, user_message, user_name, turns, mode, vitals, session_id, audio_format, vitals_state, debate_mode, stream_audio):
+            yield speech
+
+async def _stream_debate(queue: TurnQueue, user_message, user_name, turns, mode, vitals, session_id, audio_format, vitals_state, debate_mode, stream_audio):
+    # This message makes every earlier debate or poke in the session obsolete
+    generation = queue.supersede()
+    start = perf_counter()
+    first = True
+    # History lines this run added, and how many of them reached the client
+    lines = []
+    delivered = 0
+
+    def rollback():
+        # Superseded or abandoned: lines past `delivered` were never heard
+        undelivered = lines[delivered:]
+        del lines[delivered:]
+        if undelivered:
+            _retract(session_id, undelivered)
+
+    queue.rollbacks.add(rollback)
+
+    pending = asyncio.Queue()
+    done = object()
+
+    async def produce():
+        # Text generation runs as its own task so the consumer can hand
+        # finished audio to the client while later turns are still written.
+        try:
+            async for turn in _prepare_debate(user_message, user_name, turns, mode, vitals, session_id, vitals_state, debate_mode):
+                lines.append(f"{turn['character']['name']}: {turn['text']}")
+                pending.put_nowait(queue.spawn(_synthesize_turn(turn, session_id, audio_format, stream_audio)))
+        except Exception as e:
+            pending.put_nowait(e)
+        finally:
+            pending.put_nowait(done)
+
+    producer = queue.spawn(produce())
+    try:
+        while True:
+            item = await pending.get()
+            if queue.generation != generation:
+                print(f"[{request_id_var.get()}] debate superseded by a newer message (session {session_id})")
+                break
+            if item is done:
+                observe("debate.total", perf_counter() - start)
+                _speculate(session_id, audio_format)
+                break
+            if isinstance(item, Exception):
+                raise item
+            # Waits without letting a cancelled turn cancel this request
+            await asyncio.wait((item,))
+            if item.cancelled():
+                continue
+            data = item.result()
+            if first and data["audioUrl"]:
+                observe("debate.first_audio", perf_counter() - start)
+                first = False
+            delivered += 1
+            yield data
+    finally:
+        queue.rollbacks.discard(rollback)
+        # Client went away or something failed: stop paying for unheard turns
+        producer.cancel()
+        while not pending.empty():
+            item = pending.get_nowait()
+            if isinstance(item, asyncio.Task):
+                item.cancel()
+        rollback()
+
+async def run_debate(user_message: str, user_name: str = "User", turns: int = 3, mode: str = "chat", vitals = None, session_id: str = "default", audio_format: str = DEFAULT_AUDIO_FORMAT, vitals_state = None, debate_mode: str = None, stream_audio: bool = None):
+    """
+    Simulates a debate turn.
+    Returns a list of speech objects.
+    `vitals_state` (e.g. the smoothed state from vitals.py) overrides analyzing raw `vitals`.
+    `debate_mode` ("turns" or "script") overrides DEBATE_MODE.
+    `stream_audio` overrides STREAM_AUDIO (MP3 only): audio URLs stream while still being synthesized.
+    """
+    return [speech async for speech in stream_debate(user_message, user_name, turns, mode, vitals, session_id, audio_format, vitals_state, debate_mode, stream_audio)]
+
+async def run_single_turn(duck_id: int, user_name: str = "User", session_id: str = "default", audio_format: str = DEFAULT_AUDIO_FORMAT, stream_audio: bool = None):
     """
     Forces a specific duck to respond to the current history.
+    `stream_audio` works as in `run_debate`.
+    Repeated pokes of the same duck while its reply is still being made get
+    that same reply. A newer message in the session cancels it and returns [].
     """
     character = get_character_by_id(duck_id)
     if not character:
         return []
+    print(f"[{request_id_var.get()}] starting run_single_turn for {character['name']} (session {session_id})")
+    # Pokes jump ahead of queued debate turns for provider slots
+    priority_var.set(INTERACTIVE)
 
-    session_id = "default"
-    if session_id not in conversations:
-        conversations[session_id] = []
-    history = conversations[session_id]
-    
-    history_text = "CONVERSATION HISTORY:\n" + "\n".join(history)
-    
+    key = (duck_id, audio_format, stream_audio)
+    with _turn_queue(session_id) as queue:
+        task = queue.pokes.get(key)
+        if task is None:
+            lines = []
+            task = queue.pokes[key] = queue.spawn(_single_turn(character, duck_id, session_id, audio_format, stream_audio, lines))
+
+            def rollback():
+                # Superseded before the reply was returned
+                if lines:
+                    _retract(session_id, lines)
+
+            def forget(_):
+                queue.rollbacks.discard(rollback)
+                if queue.pokes.get(key) is task:
+                    del queue.pokes[key]
+            queue.rollbacks.add(rollback)
+            task.add_done_callback(forget)
+        else:
+            turn_queue_counts["coalesced"] += 1
+            print(f"[{request_id_var.get()}] joining in-flight poke for {character['name']}")
+        # asyncio.wait never cancels `task`, so one caller going away leaves the reply to the others
+        await asyncio.wait((task,))
+        if task.cancelled():
+            return []
+        return task.result()
+
+async def _single_turn(character, duck_id: int, session_id: str, audio_format: str, stream_audio: bool | None, lines: list):
+    # The history line goes into `lines` too, so a superseded poke can take it back
     # Generate just one turn
-    # We reuse the parallel logic or just call directly since it's 1 turn
-    ts = time.strftime("%Y%m%d-%H%M%S")
-    static_dir = Path("static/audio") / ts
-    static_dir.mkdir(parents=True, exist_ok=True)
-    
-    text = generate_reply(character, history_text)
+    session = sessions.get(session_id)
+    async with session.lock:
+        sessions.refresh(session)
+        history = session.memory
+        speculative = await speculator.take(session, duck_id)
+        if speculative:
+            text = speculative["text"]
+        else:
+            text = await generate_reply_async(character, history.prompt())
+        
+        # Update history
+        history.append(f"{character['name']}: {text}")
+        lines.append(f"{character['name']}: {text}")
+        sessions.save(session)
+    _speculate(session_id, audio_format)
     mood = determine_mood(text, character["style"])
     
-    # Update history
-    line = f"{character['name']}: {text}"
-    history.append(line)
-    conversations[session_id] = history
-    
     # TTS
-    filename = f"0_{character['name']}.wav"
-    out_path = static_dir / filename
-    web_path = f"/static/audio/{ts}/{filename}"
-    
-    tts_to_wav(text, character["voice_id"], str(out_path))
-    
-    word_count = len(text.split())
-    duration = max(2000, word_count * 400)
+    if speculative and "artifact" in speculative and speculative["audio_format"] == audio_format:
+        artifact = audio_store.commit(speculative["artifact"])
+        timing = speculative["timing"]
+    else:
+        if speculative and "artifact" in speculative:
+            speculative["artifact"].path.unlink(missing_ok=True)
+        artifact = audio_store.allocate(AUDIO_FORMATS[audio_format][0], session_id)
+        if _streams_audio(stream_audio, audio_format):
+            _start_relay(text, character["voice_id"], artifact, session_id)
+            return [{"duckId": duck_id, "text": text, "audioUrl": artifact.url, "mood": mood,
+                     "duration": _estimated_duration(text), "streaming": True}]
+        try:
+            with span("tts"):
+                timing = await tts_to_file_async(text, character["voice_id"], str(artifact.path), audio_format)
+            audio_store.commit(artifact)
+        except Exception as e:
+            # The line is already in the history; show it even without audio
+            print(f"Error generating audio: {e}")
+            artifact.path.unlink(missing_ok=True)
+            return [{"duckId": duck_id, "text": text, "mood": mood, **_text_only(text)}]
+        except BaseException:
+            artifact.path.unlink(missing_ok=True)
+            raise
     
     return [{
         "duckId": duck_id,
         "text": text,
-        "audioUrl": web_path,
-        "duration": duration,
-        "mood": mood
+        "audioUrl": artifact.url,
+        "mood": mood,
+        **timing
     }]
 
 def analyze_vitals_state(vitals):
@@ -261,5 +589,14 @@ def select_next_speaker(current_speaker, vitals_state):
     
     return random.choice(candidates) if candidates else random.choice(CHARACTERS)
 
-def reset_history():
-    conversations["default"] = []
+def _speculate(session_id: str, audio_format: str):
+    characters = {NAME_TO_ID[c["name"]]: c for c in CHARACTERS if c["name"] in NAME_TO_ID}
+    speculator.refresh(sessions.get(session_id), characters, audio_format)
+
+def reset_history(session_id: str = "default"):
+    queue = _queues.get(session_id)
+    if queue:
+        queue.supersede()
+    speculator.discard(session_id)
+    sessions.reset(session_id)
+    audio_store.delete_session(session_id)
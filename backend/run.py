@@ -1,4 +1,10 @@
+import os
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    # Several workers only share conversations, vitals and audio with STATE_BACKEND=sqlite
+    workers = int(os.getenv("WORKERS", "1"))
+    if workers > 1 and os.getenv("STATE_BACKEND", "memory") == "memory":
+        print("WORKERS > 1 with STATE_BACKEND=memory: each worker will keep its own sessions and vitals")
+    # Auto-reload watches the tree and re-imports everything on change; opt in with RELOAD=1 for development
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=os.getenv("RELOAD") == "1", workers=workers)
@@ -0,0 +1,242 @@
+import os
+import heapq
+import random
+import asyncio
+import itertools
+from time import monotonic
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from metrics import register_collector
+
+# Lower runs first when a provider is saturated
+INTERACTIVE, BULK, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk", BACKGROUND: "background"}
+# Set by the caller (poke vs debate vs speculation); inherited by tasks it creates
+priority_var = ContextVar("provider_priority", default=BULK)
+
+PROVIDER_GLOBAL_CONCURRENCY = int(os.getenv("PROVIDER_GLOBAL_CONCURRENCY", "24"))
+
+def _env_float(name: str, default: str | None):
+    value = os.getenv(name, default)
+    return float(value) if value not in (None, "") else None
+
+class ProviderConfig:
+    def __init__(self, name: str, concurrency: int, timeout: float | None, retries: int, hedge_after: float | None,
+                 backoff: float = 0.25, breaker_threshold: int = 5, breaker_cooldown: float = 30.0):
+        self.name = name
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.hedge_after = hedge_after
+        self.backoff = backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+
+    @classmethod
+    def from_env(cls, name: str, concurrency: str, timeout: str, retries: str = "2"):
+        prefix = name.upper()
+        return cls(
+            name,
+            concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", concurrency)),
+            timeout=_env_float(f"{prefix}_TIMEOUT_S", timeout),
+            retries=int(os.getenv(f"{prefix}_RETRIES", retries)),
+            # Unset = no hedging; otherwise seconds before a duplicate request is sent
+            hedge_after=_env_float(f"{prefix}_HEDGE_AFTER_S", None),
+            breaker_threshold=int(os.getenv(f"{prefix}_BREAKER_THRESHOLD", "5")),
+            breaker_cooldown=float(os.getenv(f"{prefix}_BREAKER_COOLDOWN_S", "30")),
+        )
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+class _PriorityLimiter:
+    """
+    Semaphore whose waiters are woken by priority, then arrival order.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    async def acquire(self, priority: int):
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # The slot was handed over just as we were cancelled
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                # Hand the slot straight to the next waiter
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+class _Breaker:
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    @property
+    def open(self) -> bool:
+        return self.opened_at is not None and monotonic() - self.opened_at < self.cooldown
+
+    def check(self, name: str) -> bool:
+        """Raises CircuitOpenError if open; returns True for the half-open trial call."""
+        if self.opened_at is None:
+            return False
+        # Half-open after the cooldown: one trial call goes through, the rest
+        # are rejected until it succeeds
+        if self.open or self.trial:
+            raise CircuitOpenError(f"{name} circuit open after {self.failures} consecutive failures")
+        self.trial = True
+        return True
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def failure(self):
+        self.failures += 1
+        # Also re-opens immediately when the half-open trial call fails
+        if self.trial or self.failures >= self.threshold:
+            self.opened_at = monotonic()
+        self.trial = False
+
+    def release(self):
+        # The trial ended without a verdict (cancelled or a non-retryable error)
+        self.trial = False
+
+def _retryable(error: Exception) -> bool:
+    # Callers mark errors that must not be retried, e.g. after part of a stream was relayed
+    if isinstance(error, (ValueError, CircuitOpenError)) or not getattr(error, "retryable", True):
+        return False
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status not in (408, 429):
+        return False
+    return True
+
+class ProviderScheduler:
+    """
+    One process-wide gate for every external provider call: global and
+    per-provider concurrency with priorities, per-attempt deadlines, retries
+    with jittered backoff, a circuit breaker, and optional hedging.
+    """
+
+    def __init__(self, providers: list[ProviderConfig], global_concurrency: int = PROVIDER_GLOBAL_CONCURRENCY):
+        self.providers = {p.name: p for p in providers}
+        self._global = _PriorityLimiter(global_concurrency)
+        self._limiters = {p.name: _PriorityLimiter(p.concurrency) for p in providers}
+        self._breakers = {p.name: _Breaker(p.breaker_threshold, p.breaker_cooldown) for p in providers}
+        # retries / hedges / calls rejected by an open circuit, per provider
+        self.counts = {f"{p.name}.{kind}": 0 for p in providers for kind in ("retries", "hedges", "rejected")}
+
+    @asynccontextmanager
+    async def _slot(self, provider: str, priority: int):
+        limiter = self._limiters[provider]
+        await limiter.acquire(priority)
+        try:
+            await self._global.acquire(priority)
+            try:
+                yield
+            finally:
+                self._global.release()
+        finally:
+            limiter.release()
+
+    async def _once(self, config: ProviderConfig, call, priority: int):
+        async with self._slot(config.name, priority):
+            return await asyncio.wait_for(call(), config.timeout)
+
+    async def _attempt(self, config: ProviderConfig, call, priority: int, hedge: bool):
+        if config.hedge_after is None or not hedge:
+            return await self._once(config, call, priority)
+
+        first = asyncio.ensure_future(self._once(config, call, priority))
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=config.hedge_after)
+            if not done:
+                self.counts[f"{config.name}.hedges"] += 1
+                tasks.add(asyncio.ensure_future(self._once(config, call, priority)))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def run(self, provider: str, call, priority: int | None = None, hedge: bool = True):
+        """
+        Runs `call()` (a zero-argument coroutine function, re-invoked on retry
+        or hedge) under `provider`'s budget. Priority defaults to priority_var.
+        Pass hedge=False for calls with side effects a duplicate would repeat.
+        """
+        config = self.providers[provider]
+        breaker = self._breakers[provider]
+        priority = priority_var.get() if priority is None else priority
+        attempt = 0
+        while True:
+            try:
+                trial = breaker.check(provider)
+            except CircuitOpenError:
+                self.counts[f"{provider}.rejected"] += 1
+                raise
+            try:
+                result = await self._attempt(config, call, priority, hedge)
+            except Exception as e:
+                if _retryable(e):
+                    breaker.failure()
+                if attempt >= config.retries or not _retryable(e) or breaker.open:
+                    raise
+                attempt += 1
+                self.counts[f"{provider}.retries"] += 1
+                print(f"{provider} call failed ({e!r}), retry {attempt}/{config.retries}")
+                await asyncio.sleep(config.backoff * 2 ** (attempt - 1) * (0.5 + random.random()))
+                continue
+            finally:
+                if trial:
+                    breaker.release()
+            breaker.success()
+            return result
+
+    def stats(self) -> dict:
+        stats = {"global.active": self._global.active, "global.waiting": self._global.waiting}
+        for name, limiter in self._limiters.items():
+            stats[f"{name}.active"] = limiter.active
+            stats[f"{name}.waiting"] = limiter.waiting
+            stats[f"{name}.circuit_open"] = int(self._breakers[name].open)
+        return {**stats, **self.counts}
+
+scheduler = ProviderScheduler([
+    ProviderConfig.from_env("gemini", concurrency="8", timeout="20"),
+    # ElevenLabs plans cap concurrent requests; stay under it rather than collect 429s
+    ProviderConfig.from_env("elevenlabs", concurrency="3", timeout="30"),
+    ProviderConfig.from_env("stt", concurrency="4", timeout="30", retries="0"),
+])
+
+register_collector("duck_provider_scheduler", "Provider slots in use, queue depth, circuit state and retry/hedge counts", "field", scheduler.stats)
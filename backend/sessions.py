@@ -0,0 +1,127 @@
+import os
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from lru import evict_lru
+from memory import ConversationMemory
+from state import SqliteBackend, default_backend
+
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1000"))
+SESSION_IDLE_TTL_S = float(os.getenv("SESSION_IDLE_TTL_S", "3600"))
+# Set to a file path to persist histories across evictions and restarts (implied by STATE_BACKEND=sqlite)
+SESSION_DB = os.getenv("SESSION_DB")
+# Conflicting saves from other workers to ride out before overwriting anyway
+SAVE_RETRIES = 5
+
+class Session:
+    def __init__(self, session_id: str, memory: ConversationMemory | None = None):
+        self.id = session_id
+        self.memory = memory or ConversationMemory()
+        # Serializes history mutations for this session only
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        # Tag of the stored snapshot this memory matches; None if never stored
+        self.rev = None
+
+class SessionStore:
+    """
+    Sessions keyed by ID, evicted least-recently-used past `max_sessions`
+    and after `idle_ttl` seconds without use. Busy sessions are never evicted.
+
+    With `sync`, the backend is shared with other worker processes:
+    `refresh` reloads histories they have changed, and `save` only writes
+    over the revision it last saw, replaying this worker's new lines on top
+    of theirs if another worker saved first.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, idle_ttl: float = SESSION_IDLE_TTL_S, backend = None, sync: bool = False):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.backend = backend
+        self.sync = sync
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def get(self, session_id: str) -> Session:
+        session = self._sessions.get(session_id)
+        if session is None:
+            data = self.backend.get("sessions", session_id) if self.backend else None
+            memory = ConversationMemory.from_snapshot(data) if data else None
+            session = self._sessions[session_id] = Session(session_id, memory)
+            if self.backend:
+                # Stores the shorter history once a fold lands
+                session.memory.on_fold = lambda: self.save(session)
+            session.rev = data.get("rev") if data else None
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_used = time.monotonic()
+        self.evict(keep=session_id)
+        return session
+
+    def refresh(self, session: Session):
+        """
+        Picks up a snapshot another worker saved since we last saw this
+        session. Call with `session.lock` held, right before reading or
+        changing the history. No-op unless the backend is shared.
+        """
+        if not self.sync:
+            return
+        data = self.backend.get("sessions", session.id)
+        if data is None:
+            if session.rev is not None:
+                # Reset by another worker
+                session.memory.clear()
+                session.rev = None
+        elif data.get("rev") != session.rev:
+            session.memory.load(data)
+            session.rev = data.get("rev")
+
+    def save(self, session: Session):
+        if not self.backend:
+            session.memory.unsaved.clear()
+            return
+        for _ in range(SAVE_RETRIES):
+            rev = uuid.uuid4().hex
+            snapshot = {**session.memory.snapshot(), "rev": rev}
+            if not self.sync:
+                self.backend.put("sessions", session.id, snapshot)
+                break
+            if self.backend.put_if_rev("sessions", session.id, snapshot, session.rev):
+                break
+            # Another worker saved first: replay our new lines on top of its history.
+            # Merged in place, since a running debate may still hold this memory.
+            data = self.backend.get("sessions", session.id)
+            session.memory.load(data or {}, list(session.memory.unsaved))
+            session.rev = data.get("rev") if data else None
+        else:
+            print(f"Session {session.id} kept conflicting on save; overwriting")
+            self.backend.put("sessions", session.id, {**session.memory.snapshot(), "rev": rev})
+        session.memory.unsaved.clear()
+        session.rev = rev
+
+    def reset(self, session_id: str):
+        session = self._sessions.pop(session_id, None)
+        if session:
+            session.memory.clear()
+        if self.backend:
+            self.backend.delete("sessions", session_id)
+
+    def evict(self, keep: str | None = None):
+        for _, session in evict_lru(self._sessions, self.max_sessions, self.idle_ttl, lambda s: s.lock.locked(), keep):
+            if self.sync:
+                # Other workers may have saved newer history; the stored copy is the truth
+                session.memory.cancel_fold()
+            else:
+                self.save(session)
+
+def default_store() -> SessionStore:
+    backend = default_backend()
+    if backend.shared:
+        return SessionStore(backend=backend, sync=True)
+    return SessionStore(backend=SqliteBackend(SESSION_DB) if SESSION_DB else None)
@@ -0,0 +1,122 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from llm_gemini import generate_reply_async
+from tts_eleven import tts_to_file_async, AUDIO_FORMATS
+from scheduler import priority_var, BACKGROUND
+
+# Pre-generate a reply per duck after every history change so pokes answer instantly
+SPECULATIVE_POKES = os.getenv("SPECULATIVE_POKES", "0") == "1"
+# Also synthesize the speculative replies (costs TTS characters for lines that may never play)
+SPECULATIVE_AUDIO = os.getenv("SPECULATIVE_AUDIO", "0") == "1"
+# Spend cap: speculative LLM calls allowed per minute across all sessions
+SPECULATIVE_CALLS_PER_MIN = int(os.getenv("SPECULATIVE_CALLS_PER_MIN", "30"))
+SPECULATIVE_MAX_SESSIONS = int(os.getenv("SPECULATIVE_MAX_SESSIONS", "256"))
+
+class Speculator:
+    """
+    Per-session cache of speculative duck replies, tagged with the history
+    version they were generated against and discarded when it moves on.
+    """
+
+    def __init__(self, audio_store, enabled: bool = SPECULATIVE_POKES, with_audio: bool = SPECULATIVE_AUDIO,
+                 calls_per_minute: int = SPECULATIVE_CALLS_PER_MIN, max_sessions: int = SPECULATIVE_MAX_SESSIONS):
+        self.audio_store = audio_store
+        self.enabled = enabled
+        self.with_audio = with_audio
+        self.calls_per_minute = calls_per_minute
+        self.max_sessions = max_sessions
+        self._entries = OrderedDict()  # session_id -> {"version": int, "tasks": {duck_id: Task}}
+        self._spent = deque()
+        self.counters = {"hits": 0, "misses": 0, "discarded": 0, "over_budget": 0, "calls": 0}
+
+    def _within_budget(self) -> bool:
+        now = time.monotonic()
+        while self._spent and now - self._spent[0] > 60:
+            self._spent.popleft()
+        if len(self._spent) >= self.calls_per_minute:
+            return False
+        self._spent.append(now)
+        return True
+
+    def refresh(self, session, characters: dict, audio_format: str):
+        """
+        Starts speculative replies for every duck against the session's
+        current history, unless they already exist for this version.
+        """
+        if not self.enabled:
+            return
+        entry = self._entries.get(session.id)
+        if entry and entry["version"] == session.memory.version:
+            return
+        self.discard(session.id)
+
+        prompt = session.memory.prompt()
+        tasks = {}
+        for duck_id, character in characters.items():
+            if not self._within_budget():
+                self.counters["over_budget"] += 1
+                continue
+            self.counters["calls"] += 1
+            tasks[duck_id] = asyncio.create_task(self._generate(session.id, character, prompt, audio_format))
+        self._entries[session.id] = {"version": session.memory.version, "tasks": tasks}
+
+        while len(self._entries) > self.max_sessions:
+            self.discard(next(iter(self._entries)))
+
+    async def _generate(self, session_id: str, character, prompt: str, audio_format: str):
+        # Guesses only use provider slots nobody with a real request is waiting for
+        priority_var.set(BACKGROUND)
+        text = await generate_reply_async(character, prompt)
+        result = {"text": text, "audio_format": audio_format}
+        if self.with_audio:
+            artifact = self.audio_store.allocate(AUDIO_FORMATS[audio_format][0], session_id)
+            try:
+                result["timing"] = await tts_to_file_async(text, character["voice_id"], str(artifact.path), audio_format)
+            except BaseException:
+                artifact.path.unlink(missing_ok=True)
+                raise
+            result["artifact"] = artifact
+        return result
+
+    async def take(self, session, duck_id: int):
+        """
+        Returns the speculative reply for `duck_id` if it was generated against
+        the current history and has finished, else None. An unfinished guess
+        is cancelled: it runs at background priority and may still be queued
+        behind other background work, so the caller does better with a fresh
+        interactive call.
+        """
+        entry = self._entries.get(session.id)
+        if not self.enabled or not entry or entry["version"] != session.memory.version or duck_id not in entry["tasks"]:
+            self.counters["misses"] += 1
+            return None
+        task = entry["tasks"].pop(duck_id)
+        if not task.done() or task.cancelled():
+            task.cancel()
+            self.counters["misses"] += 1
+            return None
+        try:
+            result = task.result()
+        except Exception as e:
+            print(f"Speculative reply failed: {e}")
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        return result
+
+    def discard(self, session_id: str):
+        entry = self._entries.pop(session_id, None)
+        if not entry:
+            return
+        for task in entry["tasks"].values():
+            self.counters["discarded"] += 1
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled() and task.exception() is None and "artifact" in task.result():
+                task.result()["artifact"].path.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {**self.counters, "hit_rate": self.counters["hits"] / lookups if lookups else 0.0}
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from functools import lru_cache
+
+# "memory": state lives in this process (single worker)
+# "sqlite": state is shared through STATE_DB, so several uvicorn workers see the same sessions, vitals and audio
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB = os.getenv("STATE_DB", "state.db")
+
+class MemoryBackend:
+    """
+    Namespaced key -> dict storage in plain dicts. Values are stored as given,
+    so callers must not mutate a dict after `put`.
+    """
+
+    # Other processes cannot see this state
+    shared = False
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> dict | None:
+        with self._lock:
+            return self._data.get(namespace, {}).get(key)
+
+    def put(self, namespace: str, key: str, value: dict):
+        with self._lock:
+            self._data.setdefault(namespace, {})[key] = value
+
+    def add(self, namespace: str, key: str, value: dict) -> bool:
+        """Stores `value` only if `key` is new; returns whether it was stored."""
+        with self._lock:
+            entries = self._data.setdefault(namespace, {})
+            if key in entries:
+                return False
+            entries[key] = value
+            return True
+
+    def put_if_rev(self, namespace: str, key: str, value: dict, rev: str | None) -> bool:
+        """
+        Stores `value` only if the stored value's "rev" is still `rev` (None:
+        only if `key` is new); returns whether it was stored.
+        """
+        with self._lock:
+            entries = self._data.setdefault(namespace, {})
+            current = entries.get(key)
+            if current is None and rev is not None:
+                return False
+            if current is not None and (rev is None or current.get("rev") != rev):
+                return False
+            entries[key] = value
+            return True
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._data.get(namespace, {}).pop(key, None)
+
+    def items(self, namespace: str) -> list[tuple[str, dict]]:
+        with self._lock:
+            return list(self._data.get(namespace, {}).items())
+
+class SqliteBackend:
+    """
+    Same interface on one SQLite file in WAL mode: readers in other worker
+    processes never block on a writer, and every write is visible to them
+    as soon as it commits.
+    """
+
+    shared = True
+
+    def __init__(self, path: str = STATE_DB):
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL only syncs at checkpoints; a power cut may lose the last writes, never corrupt the file
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._mutex = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> dict | None:
+        with self._mutex:
+            row = self._conn.execute("SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, namespace: str, key: str, value: dict):
+        with self._mutex:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, updated) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), time.time()),
+            )
+
+    def add(self, namespace: str, key: str, value: dict) -> bool:
+        with self._mutex:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO state (namespace, key, value, updated) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), time.time()),
+            )
+        return cursor.rowcount == 1
+
+    def put_if_rev(self, namespace: str, key: str, value: dict, rev: str | None) -> bool:
+        # One statement, so the check and the write are atomic across processes
+        if rev is None:
+            return self.add(namespace, key, value)
+        with self._mutex:
+            cursor = self._conn.execute(
+                "UPDATE state SET value = ?, updated = ? WHERE namespace = ? AND key = ? AND json_extract(value, '$.rev') = ?",
+                (json.dumps(value), time.time(), namespace, key, rev),
+            )
+        return cursor.rowcount == 1
+
+    def delete(self, namespace: str, key: str):
+        with self._mutex:
+            self._conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def items(self, namespace: str) -> list[tuple[str, dict]]:
+        with self._mutex:
+            rows = self._conn.execute("SELECT key, value FROM state WHERE namespace = ?", (namespace,)).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+# name -> factory; add entries here to plug in another store (e.g. Redis)
+BACKENDS = {
+    "memory": MemoryBackend,
+    "sqlite": SqliteBackend,
+}
+
+@lru_cache(maxsize=1)
+def default_backend():
+    if STATE_BACKEND not in BACKENDS:
+        raise ValueError(f"Unknown STATE_BACKEND: {STATE_BACKEND}")
+    return BACKENDS[STATE_BACKEND]()
@@ -1,13 +1,15 @@
-import static_ffmpeg
-static_ffmpeg.add_paths()
-import speech_recognition as sr
+import os
+import asyncio
+import subprocess
+from functools import lru_cache
 #import sounddevice as sd
 import soundfile as sf
 import numpy as np
-import tempfile
 from io import BytesIO
 from fastapi import UploadFile
-from pydub import AudioSegment
+from audio_dsp import to_mono, resample, trim_silence, to_pcm16, Endpointer
+from metrics import span
+from scheduler import scheduler, INTERACTIVE
 
 """
 def listen_for_question() -> str:
@@ -44,34 +46,228 @@ def listen_for_question() -> str:
             return ""
         
 """
-        
-def stt(audio: UploadFile) -> str:
-    print("starting speech to text")
-    print(type(audio))
-    recognizer = sr.Recognizer()
-    
+
+STT_SAMPLE_RATE = 16000
+# Which recognizer `transcribe` uses; see RECOGNIZERS
+STT_BACKEND = os.getenv("STT_BACKEND", "google")
+
+class GoogleRecognizer:
+    """Free Google Web Speech API (network)."""
+
+    def __init__(self):
+        import speech_recognition as sr
+        self._recognizer = sr.Recognizer()
+
+    def recognize(self, audio_data) -> str:
+        return self._recognizer.recognize_google(audio_data)
+
+class SphinxRecognizer:
+    """CMU Sphinx, fully offline; needs `pip install pocketsphinx`."""
+
+    def __init__(self):
+        import speech_recognition as sr
+        self._recognizer = sr.Recognizer()
+
+    def recognize(self, audio_data) -> str:
+        return self._recognizer.recognize_sphinx(audio_data)
+
+class WhisperRecognizer:
+    """Local faster-whisper model; needs `pip install faster-whisper`."""
+
+    def __init__(self, model: str = os.getenv("WHISPER_MODEL", "base")):
+        import speech_recognition as sr
+        self._recognizer = sr.Recognizer()
+        self._model = model
+
+    def recognize(self, audio_data) -> str:
+        return self._recognizer.recognize_faster_whisper(audio_data, model=self._model).strip()
+
+# name -> factory; add entries here (or via register_recognizer) to plug in another backend
+RECOGNIZERS = {
+    "google": GoogleRecognizer,
+    "sphinx": SphinxRecognizer,
+    "whisper": WhisperRecognizer,
+}
+_recognizers = {}
+
+def register_recognizer(name: str, factory):
+    RECOGNIZERS[name] = factory
+    _recognizers.pop(name, None)
+
+def get_recognizer(name: str = None):
+    name = name or STT_BACKEND
+    if name not in _recognizers:
+        if name not in RECOGNIZERS:
+            raise ValueError(f"Unknown STT backend: {name}")
+        _recognizers[name] = RECOGNIZERS[name]()
+    return _recognizers[name]
+
+@lru_cache(maxsize=1)
+def ensure_ffmpeg():
+    # May download/unpack ffmpeg on first run, so it happens in warmup or on first use, not at import
+    import static_ffmpeg
+    static_ffmpeg.add_paths()
+
+def _ffmpeg_decode(audio_content: bytes, sample_rate: int = 48000) -> tuple[np.ndarray, int]:
+    # Browser uploads (webm/opus, mp4) need ffmpeg; stream through pipes, never the filesystem
+    ensure_ffmpeg()
+    result = subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-i", "pipe:0", "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"],
+        input=audio_content, capture_output=True, check=True,
+    )
+    return np.frombuffer(result.stdout, dtype="<f4"), sample_rate
+
+def decode_audio(audio_content: bytes) -> np.ndarray:
+    """
+    Decodes an upload to 16 kHz mono float samples without touching disk.
+    """
+    with span("stt.decode"):
+        try:
+            audio, sample_rate = sf.read(BytesIO(audio_content), dtype="float32")
+        except Exception:
+            audio, sample_rate = _ffmpeg_decode(audio_content)
+        return resample(to_mono(audio), sample_rate, STT_SAMPLE_RATE)
+
+def transcribe(audio_content: bytes, backend: str = None) -> str:
     try:
-        # Read the audio file content
-        audio_content = audio.file.read()
-        
-        audio_segment = AudioSegment.from_file(BytesIO(audio_content))
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_wav:
-            audio_segment.export(temp_wav.name, format="wav")
-            temp_wav_path = temp_wav.name
-            
-        # Use the audio file with speech_recognition
-        with sr.AudioFile(temp_wav_path) as source:
-            audio_data = recognizer.record(source)
+        samples = decode_audio(audio_content)
+    except Exception as e:
+        print(f"Could not decode the audio; {e}")
+        return ""
+    return transcribe_samples(samples, backend)
+
+def transcribe_samples(samples: np.ndarray, backend: str = None) -> str:
+    """
+    Recognizes 16 kHz mono float samples; "" when there is no usable speech.
+    """
+    import speech_recognition as sr
+    try:
+        samples = trim_silence(samples, STT_SAMPLE_RATE)
+        if len(samples) == 0:
+            print("No speech detected in the audio.")
+            return ""
+        audio_data = sr.AudioData(to_pcm16(samples), STT_SAMPLE_RATE, 2)
 
         # Perform speech-to-text
-        message = recognizer.recognize_google(audio_data)
-        return message 
+        with span("stt.recognize"):
+            return get_recognizer(backend).recognize(audio_data)
     except sr.UnknownValueError:
         print("Could not understand the audio.")
         return ""
     except sr.RequestError as e:
-        print(f"Could not request results from Google Speech Recognition service; {e}")
+        print(f"Could not request results from the speech recognition service; {e}")
         return ""
     except Exception as e:
         print(e)
-        
\ No newline at end of file
+        return ""
+
+async def stt_async(audio: UploadFile) -> str:
+    """
+    Transcribes a finished upload (the batch /chat-audio path): reads it on
+    the event loop and runs the blocking decode + recognition in a worker
+    thread under the "stt" budget. Live microphones use `SpeechIngest`.
+    """
+    print("starting speech to text")
+    audio_content = await audio.read()
+    with span("stt"):
+        return await scheduler.run("stt", lambda: asyncio.to_thread(transcribe, audio_content), priority=INTERACTIVE)
+
+# Live ingest: quiet after speech that ends an utterance, and a hard cap on its length
+ENDPOINT_SILENCE_MS = int(os.getenv("ENDPOINT_SILENCE_MS", "700"))
+MAX_UTTERANCE_S = float(os.getenv("MAX_UTTERANCE_S", "30"))
+# "webm": MediaRecorder chunks (anything ffmpeg reads from a pipe); "pcm16": raw little-endian mono
+INGEST_ENCODINGS = ("webm", "pcm16")
+
+class SpeechIngest:
+    """
+    One live utterance. Encoded chunks are fed in as the browser records
+    them and decoded straight away (ffmpeg over pipes, or nothing for raw
+    PCM), and an Endpointer watches the samples. `ended` is set the moment
+    the speaker stops, so `transcribe` only has recognition left to do.
+    """
+
+    def __init__(self, encoding: str = "webm", sample_rate: int = STT_SAMPLE_RATE):
+        if encoding not in INGEST_ENCODINGS:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+        self.encoding = encoding
+        self.sample_rate = sample_rate
+        self.endpointer = Endpointer(STT_SAMPLE_RATE, silence_ms=ENDPOINT_SILENCE_MS)
+        self.ended = asyncio.Event()
+        self._samples = []
+        self._count = 0
+        self._tail = b""
+        self._proc = None
+        self._reader = None
+
+    async def start(self):
+        if self.encoding == "pcm16":
+            return
+        await asyncio.to_thread(ensure_ffmpeg)
+        self._proc = await asyncio.create_subprocess_exec(
+            # Small probe and per-packet flushes, so samples come out while the user is still talking
+            "ffmpeg", "-loglevel", "error", "-probesize", "8192", "-analyzeduration", "0", "-i", "pipe:0",
+            "-f", "f32le", "-ac", "1", "-ar", str(STT_SAMPLE_RATE), "-flush_packets", "1", "pipe:1",
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+        self._reader = asyncio.create_task(self._read_decoded())
+
+    async def _read_decoded(self):
+        tail = b""
+        while data := await self._proc.stdout.read(8192):
+            data = tail + data
+            usable = len(data) - len(data) % 4
+            tail = data[usable:]
+            self._add(np.frombuffer(data[:usable], dtype="<f4"))
+
+    def _add(self, samples: np.ndarray):
+        self._samples.append(samples)
+        self._count += len(samples)
+        if self.endpointer.feed(samples) or self._count >= MAX_UTTERANCE_S * STT_SAMPLE_RATE:
+            self.ended.set()
+
+    async def feed(self, data: bytes):
+        """
+        Adds one encoded chunk. Ignored once the utterance has ended.
+        """
+        if self.ended.is_set():
+            return
+        if self.encoding == "pcm16":
+            data = self._tail + data
+            usable = len(data) - len(data) % 2
+            self._tail = data[usable:]
+            samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768
+            self._add(resample(samples, self.sample_rate, STT_SAMPLE_RATE))
+        elif self._proc.returncode is None:
+            self._proc.stdin.write(data)
+            await self._proc.stdin.drain()
+
+    async def finish(self):
+        """
+        Flushes whatever the decoder still holds; call when the user has
+        stopped, whether the endpointer or the client said so.
+        """
+        if self._proc and not self._proc.stdin.is_closing():
+            self._proc.stdin.close()
+            await self._reader
+            await self._proc.wait()
+        self.ended.set()
+
+    def close(self):
+        if self._proc and self._proc.returncode is None:
+            self._proc.kill()
+        if self._reader:
+            self._reader.cancel()
+
+    async def transcribe(self, backend: str = None) -> str:
+        await self.finish()
+        samples = np.concatenate(self._samples) if self._samples else np.zeros(0, dtype=np.float32)
+        with span("stt"):
+            return await scheduler.run("stt", lambda: asyncio.to_thread(transcribe_samples, samples, backend), priority=INTERACTIVE)
+
+async def warmup():
+    """
+    Puts ffmpeg on PATH and builds the configured recognizer before the first upload.
+    """
+    with span("warmup.stt"):
+        await asyncio.to_thread(ensure_ffmpeg)
+        await asyncio.to_thread(get_recognizer)
@@ -0,0 +1,112 @@
+import os
+import hashlib
+import tempfile
+import threading
+import unicodedata
+from pathlib import Path
+from collections import OrderedDict
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "cache/tts")
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+
+def normalize_text(text: str) -> str:
+    # Case and punctuation change the delivery ("HONK!" vs "honk"), so only whitespace is folded
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def cache_key(voice_id: str, text: str, output_format: str) -> str:
+    raw = f"{voice_id}\0{normalize_text(text)}\0{output_format}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class TTSCache:
+    """
+    Content-addressed audio cache: an in-memory LRU in front of a size-bounded
+    directory of files named by key. The directory survives restarts.
+
+    Each process keeps its own index of the directory, so with several
+    workers sharing it the disk can hold up to `disk_bytes` per worker.
+    """
+
+    def __init__(self, directory: str = TTS_CACHE_DIR, memory_bytes: int = TTS_CACHE_MEMORY_BYTES, disk_bytes: int = TTS_CACHE_DISK_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        # Rebuild the disk index oldest-first so eviction order survives restarts
+        files = sorted(self.directory.glob("*.bin"), key=lambda p: p.stat().st_mtime)
+        self._disk = OrderedDict((p.stem, p.stat().st_size) for p in files)
+        self._disk_size = sum(self._disk.values())
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.bin"
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return data
+            on_disk = key in self._disk
+
+        if on_disk:
+            data, gone = None, False
+            try:
+                data = self._path(key).read_bytes()
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                # Evicted by another thread or worker since we looked
+                gone = True
+            with self._lock:
+                if gone:
+                    self._disk_size -= self._disk.pop(key, 0)
+                elif key in self._disk:
+                    self._disk.move_to_end(key)
+                if data is not None:
+                    self.counters["disk_hits"] += 1
+                    self._remember(key, data)
+                    return data
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        # A unique temp name, so concurrent writers of one key never clobber each other's half-written file
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as tmp:
+            tmp.write(data)
+        os.replace(tmp.name, path)
+        with self._lock:
+            self._remember(key, data)
+            self._disk_size += len(data) - self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            while self._disk_size > self.disk_bytes and len(self._disk) > 1:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_size -= size
+                self.counters["evictions"] += 1
+                self._path(old_key).unlink(missing_ok=True)
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.memory_bytes:
+            return
+        self._memory_size += len(data) - len(self._memory.pop(key, b""))
+        self._memory[key] = data
+        while self._memory_size > self.memory_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_size -= len(old)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.counters,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_size,
+            }
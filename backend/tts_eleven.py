@@ -1,35 +1,247 @@
 import os
+import json
+import asyncio
+import httpx
 import soundfile as sf
 import numpy as np
+from io import BytesIO
 from pathlib import Path
 from dotenv import load_dotenv
-from elevenlabs import ElevenLabs
+from tts_cache import TTSCache, cache_key
+from audio_dsp import resample, amplitude_envelope, to_mono, stitch
+from metrics import span, register_collector
+from scheduler import scheduler
 
 load_dotenv()
-client = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
-
-def tts_to_wav(text: str, voice_id: str, out_path: str):
-    audio_stream = client.text_to_speech.convert(
-        voice_id=voice_id,
-        text=text,
-        output_format="mp3_44100_128"
-    )
+
+# Pooled HTTP connections shared by every TTS call
+HTTP_LIMITS = httpx.Limits(max_connections=10, max_keepalive_connections=10)
+# Built on first use (or in warmup) so importing this module stays cheap
+async_client = None
+
+def get_async_client():
+    global async_client
+    if async_client is None:
+        from elevenlabs import AsyncElevenLabs
+        async_client = AsyncElevenLabs(
+            api_key=os.getenv("ELEVENLABS_API_KEY"),
+            httpx_client=httpx.AsyncClient(limits=HTTP_LIMITS, timeout=240),
+        )
+    return async_client
+
+# Bounds how many transcodes run in worker threads at once
+TRANSCODE_SLOTS = asyncio.Semaphore(4)
+
+OUTPUT_FORMAT = "mp3_44100_128"
+# Formats we can hand to clients: name -> (file extension, MIME type)
+AUDIO_FORMATS = {
+    "mp3": ("mp3", "audio/mpeg"),   # ElevenLabs' bytes, untouched
+    "ogg": ("ogg", "audio/ogg"),    # Opus in Ogg
+    "wav": ("wav", "audio/wav"),    # uncompressed fallback
+}
+DEFAULT_AUDIO_FORMAT = "wav"
+OPUS_SAMPLE_RATE = 48000
+# Lip-sync envelope resolution sent with every line
+ENVELOPE_FPS = 30
+
+# Finished audio bytes keyed on (voice, normalized text, format)
+cache = TTSCache()
+# Identical lines requested concurrently share one synthesis:
+# key -> {"future": the synthesis, "waiters": callers still awaiting it}
+_in_flight = {}
+
+register_collector("duck_tts_cache", "TTS cache counters and sizes", "field", cache.stats)
+register_collector("duck_tts_in_flight", "Distinct lines currently being synthesized", "kind", lambda: {"synthesis": len(_in_flight)})
+
+def negotiate_audio_format(requested: str | None = None, accept: str | None = None) -> str:
+    """
+    Picks the output format: an explicit request wins, then the first audio
+    type in the Accept header we can produce, then WAV.
+    """
+    if requested:
+        requested = requested.lower()
+        if requested not in AUDIO_FORMATS:
+            raise ValueError(f"Unsupported audio format: {requested}")
+        return requested
+    for part in (accept or "").split(","):
+        mime = part.split(";")[0].strip().lower()
+        for name, (_, format_mime) in AUDIO_FORMATS.items():
+            if mime == format_mime or (name == "ogg" and mime in ("audio/opus", "audio/webm")):
+                return name
+    return DEFAULT_AUDIO_FORMAT
+
+def transcode(mp3_data: bytes, audio_format: str) -> tuple[bytes, dict]:
+    """
+    Converts ElevenLabs' MP3 bytes to `audio_format` entirely in memory.
+    Also returns the line's timing info (exact duration + lip-sync envelope)
+    computed from the decoded samples.
+    """
+    with span("transcode"):
+        audio_array, sr = sf.read(BytesIO(mp3_data))
+        info = describe_audio(audio_array, sr)
+        if audio_format == "mp3":
+            return mp3_data, info
+        return encode(audio_array, sr, audio_format), info
+
+def encode(audio: np.ndarray, sr: int, audio_format: str) -> bytes:
+    out = BytesIO()
+    if audio_format == "ogg":
+        sf.write(out, resample(audio, sr, OPUS_SAMPLE_RATE), OPUS_SAMPLE_RATE, format="OGG", subtype="OPUS")
+    elif audio_format == "mp3":
+        sf.write(out, audio, sr, format="MP3")
+    else:
+        sf.write(out, audio, sr, format="WAV")
+    return out.getvalue()
+
+def stitch_files(parts: list, audio_format: str, pause_ms: int) -> tuple[bytes, dict]:
+    """
+    Joins finished lines into one file with `pause_ms` between them. `parts`
+    holds each line's file path, or its duration in ms if it has no audio
+    (it becomes silence, so the timeline still lines up). Returns the encoded
+    bytes and `duration` plus a per-line `timeline` of offsets and durations, in ms.
+    """
+    with span("stitch"):
+        decoded = [None if isinstance(part, int) else sf.read(str(part)) for part in parts]
+        sr = next(d[1] for d in decoded if d is not None)
+        clips = []
+        for part, d in zip(parts, decoded):
+            if d is None:
+                clips.append(np.zeros(sr * part // 1000))
+            else:
+                clips.append(resample(to_mono(d[0]), d[1], sr))
+        audio, spans = stitch(clips, sr, pause_ms)
+
+        def ms(samples):
+            return int(round(samples * 1000 / sr))
+
+        info = {
+            "duration": ms(len(audio)),
+            "timeline": [{"offset": ms(offset), "duration": ms(length)} for offset, length in spans],
+        }
+        return encode(audio, sr, audio_format), info
+
+def describe_audio(audio: np.ndarray, sr: int) -> dict:
+    """
+    Speech-object timing fields: `duration` in ms and a per-frame 0-100
+    amplitude `envelope` at `envelopeFps`.
+    """
+    return {
+        "duration": int(round(len(audio) * 1000 / sr)),
+        "envelope": amplitude_envelope(audio, sr, ENVELOPE_FPS),
+        "envelopeFps": ENVELOPE_FPS,
+    }
+
+def _cache_key(text: str, voice_id: str, audio_format: str) -> str:
+    # One entry per format holds the timing info (a JSON line) followed by the audio bytes
+    return cache_key(voice_id, text, f"{OUTPUT_FORMAT}>{audio_format}+info")
+
+def _cache_get(key: str):
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    info, _, data = entry.partition(b"\n")
+    return data, json.loads(info)
+
+def _cache_put(key: str, data: bytes, info: dict):
+    cache.put(key, json.dumps(info).encode() + b"\n" + data)
+
+def _write_file(data: bytes, out_path: str):
     Path(out_path).parent.mkdir(parents=True, exist_ok=True)
-    
-    # Collect all MP3 data
-    mp3_data = b""
-    for chunk in audio_stream:
-        mp3_data += chunk
-    
-    # Write MP3, then convert to WAV using soundfile
-    mp3_path = out_path.replace('.wav', '.mp3')
-    with open(mp3_path, "wb") as f:
-        f.write(mp3_data)
-    
-    # Read MP3 and save as WAV
-    audio_array, sr = sf.read(mp3_path)
-    sf.write(out_path, audio_array, sr)
-    
-    # Clean up temp MP3
-    Path(mp3_path).unlink()
+    Path(out_path).write_bytes(data)
     return out_path
+
+async def tts_to_file_async(text: str, voice_id: str, out_path: str, audio_format: str = DEFAULT_AUDIO_FORMAT) -> dict:
+    """
+    Synthesizes `text` into `out_path` and returns its timing info. Streams
+    from ElevenLabs on the event loop and offloads the transcode to a
+    bounded worker thread.
+    """
+    key = _cache_key(text, voice_id, audio_format)
+    cached = await asyncio.to_thread(_cache_get, key)
+    if cached is None:
+        entry = _in_flight.get(key)
+        if entry is None:
+            future = asyncio.ensure_future(_synthesize(key, text, voice_id, audio_format))
+            entry = _in_flight[key] = {"future": future, "waiters": 0}
+            future.add_done_callback(lambda _, entry=entry: _forget(key, entry))
+        entry["waiters"] += 1
+        try:
+            # Shielded so one cancelled caller doesn't fail the others sharing it
+            cached = await asyncio.shield(entry["future"])
+        finally:
+            entry["waiters"] -= 1
+            if entry["waiters"] == 0 and not entry["future"].done():
+                # Nobody wants this line any more: stop the synthesis and free its slot
+                entry["future"].cancel()
+                _forget(key, entry)
+    data, info = cached
+    await asyncio.to_thread(_write_file, data, out_path)
+    return info
+
+def _forget(key: str, entry: dict):
+    # A cancelled entry may already have been replaced by a fresh synthesis
+    if _in_flight.get(key) is entry:
+        del _in_flight[key]
+
+async def tts_stream_to_file_async(text: str, voice_id: str, out_path: str, on_chunk) -> dict:
+    """
+    MP3 only: like `tts_to_file_async`, but passes each chunk to `on_chunk`
+    as ElevenLabs sends it, so playback can start before synthesis ends.
+    A cache hit arrives as a single chunk.
+    """
+    key = _cache_key(text, voice_id, "mp3")
+    cached = await asyncio.to_thread(_cache_get, key)
+    if cached is None:
+        cached = await _synthesize(key, text, voice_id, "mp3", on_chunk)
+    else:
+        on_chunk(cached[0])
+    data, info = cached
+    await asyncio.to_thread(_write_file, data, out_path)
+    return info
+
+async def stitch_to_file_async(parts: list, out_path: str, audio_format: str, pause_ms: int) -> dict:
+    """
+    Async variant of `stitch_files` that writes the result to `out_path`.
+    Shares the transcode worker threads.
+    """
+    async with TRANSCODE_SLOTS:
+        data, info = await asyncio.to_thread(stitch_files, parts, audio_format, pause_ms)
+    await asyncio.to_thread(_write_file, data, out_path)
+    return info
+
+async def _synthesize(key: str, text: str, voice_id: str, audio_format: str, on_chunk = None) -> tuple[bytes, dict]:
+    async def call():
+        chunks = []
+        with span("elevenlabs"):
+            try:
+                async for chunk in get_async_client().text_to_speech.convert(
+                    voice_id=voice_id,
+                    text=text,
+                    output_format=OUTPUT_FORMAT
+                ):
+                    chunks.append(chunk)
+                    if on_chunk:
+                        on_chunk(chunk)
+            except Exception as e:
+                if on_chunk and chunks:
+                    # Listeners already have the start of this line; a retry would repeat it
+                    e.retryable = False
+                raise
+        return b"".join(chunks)
+
+    mp3_data = await scheduler.run("elevenlabs", call, hedge=on_chunk is None)
+    async with TRANSCODE_SLOTS:
+        return await asyncio.to_thread(_transcode_and_store, key, mp3_data, audio_format)
+
+def _transcode_and_store(key: str, mp3_data: bytes, audio_format: str) -> tuple[bytes, dict]:
+    data, info = transcode(mp3_data, audio_format)
+    _cache_put(key, data, info)
+    return data, info
+
+async def warmup():
+    """
+    Builds the async client and opens a pooled connection to ElevenLabs so
+    the first line of the first debate skips DNS and TLS setup.
+    """
+    with span("warmup.elevenlabs"):
+        await get_async_client().models.list()
@@ -0,0 +1,247 @@
+import os
+import time
+import uuid
+import asyncio
+import numpy as np
+from collections import OrderedDict
+from lru import evict_lru
+from orchestrator import analyze_vitals_state
+from state import default_backend
+
+VITALS_CAPACITY = int(os.getenv("VITALS_CAPACITY", "300"))
+# Samples averaged for the smoothed reading
+VITALS_WINDOW = int(os.getenv("VITALS_WINDOW", "8"))
+# Consecutive smoothed readings a new mood must hold before we switch to it
+VITALS_HOLD = int(os.getenv("VITALS_HOLD", "3"))
+# Vitals older than this are not fed into debates
+VITALS_MAX_AGE_S = float(os.getenv("VITALS_MAX_AGE_S", "120"))
+# With a shared state backend: how often SSE subscribers check for samples posted to other workers
+VITALS_POLL_S = float(os.getenv("VITALS_POLL_S", "0.5"))
+# Buffers kept in memory, LRU/TTL-evicted like sessions; buffers with SSE subscribers are never evicted
+VITALS_MAX_SESSIONS = int(os.getenv("VITALS_MAX_SESSIONS", "1000"))
+VITALS_IDLE_TTL_S = float(os.getenv("VITALS_IDLE_TTL_S", "3600"))
+
+class VitalsBuffer:
+    """
+    Fixed-size ring buffer of vitals samples for one session, with a smoothed
+    reading and a mood that only changes after holding for VITALS_HOLD updates.
+    The response payload is recomputed on write, so reads are free.
+    """
+
+    def __init__(self, capacity: int = VITALS_CAPACITY, window: int = VITALS_WINDOW, hold: int = VITALS_HOLD):
+        # columns: timestamp_s, heart_rate_bpm, breathing_rate_rpm
+        self._samples = np.zeros((capacity, 3))
+        self._received = np.zeros(capacity)
+        self._next = 0
+        self.count = 0
+        self.capacity = capacity
+        self.window = window
+        self.hold = hold
+        self.mood_state = None
+        self._candidate = None
+        self._candidate_runs = 0
+        self.payload = empty_payload()
+        self._subscribers = set()
+        # Tag of the stored snapshot this buffer matches (shared backends only)
+        self.rev = None
+        self.last_used = time.monotonic()
+
+    def add(self, sample: dict):
+        row = self._next % self.capacity
+        # Missing readings are NaN and skipped when smoothing, rather than pulling the average to 0
+        self._samples[row] = [_reading(sample.get(name)) for name in ("timestamp_s", "heart_rate_bpm", "breathing_rate_rpm")]
+        # Wall clock, so other worker processes can judge freshness too
+        self._received[row] = time.time()
+        self._next += 1
+        self.count = min(self.count + 1, self.capacity)
+        self._update()
+
+    def recent(self, n: int) -> np.ndarray:
+        n = min(n, self.count)
+        rows = (np.arange(self._next - n, self._next)) % self.capacity
+        return self._samples[rows]
+
+    def _update(self):
+        window = self.recent(self.window)
+        timestamps = _present(window[:, 0])
+        smoothed = {
+            "timestamp_s": float(timestamps[-1]) if len(timestamps) else None,
+            "heart_rate_bpm": _mean(window[:, 1]),
+            "breathing_rate_rpm": _mean(window[:, 2]),
+        }
+        # Defaults in analyze_vitals_state stand in for a reading we don't have
+        candidate = analyze_vitals_state({k: v for k, v in smoothed.items() if k != "timestamp_s" and v is not None})
+
+        # Hysteresis: a new mood must win several readings in a row
+        if self.mood_state is None or candidate["state"] == self.mood_state["state"]:
+            # Same mood, fresher numbers in its context line
+            self.mood_state = candidate
+            self._candidate, self._candidate_runs = None, 0
+        else:
+            if candidate["state"] == self._candidate:
+                self._candidate_runs += 1
+            else:
+                self._candidate, self._candidate_runs = candidate["state"], 1
+            if self._candidate_runs >= self.hold:
+                self.mood_state = candidate
+                self._candidate, self._candidate_runs = None, 0
+
+        self.payload = {
+            **smoothed,
+            "mood": self.mood_state["state"],
+            "mood_context": self.mood_state.get("vitals_context", ""),
+            "excluded_ducks": self.mood_state.get("excluded_characters", []),
+            "preferred_ducks": self.mood_state.get("preferred_characters", []),
+        }
+        self._publish()
+
+    def _publish(self):
+        for queue in self._subscribers:
+            # Subscribers only care about the newest reading
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(self.payload)
+
+    def fresh_state(self, max_age: float = VITALS_MAX_AGE_S):
+        """
+        Smoothed, hysteresis-filtered state for debates, or None if stale/empty.
+        """
+        if not self.count:
+            return None
+        last = self._received[(self._next - 1) % self.capacity]
+        if time.time() - last > max_age:
+            return None
+        return self.mood_state
+
+    def snapshot(self) -> dict:
+        """
+        Everything another worker needs to continue this buffer: the samples
+        inside the smoothing window, the hysteresis state and the payload.
+        """
+        n = min(self.window, self.count)
+        rows = (np.arange(self._next - n, self._next)) % self.capacity
+        return {
+            "next": self._next,
+            "samples": self._samples[rows].tolist(),
+            "received": self._received[rows].tolist(),
+            "mood_state": self.mood_state,
+            "candidate": self._candidate,
+            "candidate_runs": self._candidate_runs,
+            "payload": self.payload,
+        }
+
+    def load(self, data: dict):
+        """
+        Replaces this buffer's state with a snapshot and notifies subscribers.
+        """
+        samples = np.array(data["samples"], dtype=float).reshape(-1, 3)
+        self._next = data["next"]
+        self.count = len(samples)
+        rows = (np.arange(self._next - self.count, self._next)) % self.capacity
+        self._samples[rows] = samples
+        self._received[rows] = data["received"]
+        self.mood_state = data["mood_state"]
+        self._candidate = data["candidate"]
+        self._candidate_runs = data["candidate_runs"]
+        self.payload = data["payload"]
+        self.rev = data.get("rev")
+        if self.count:
+            self._publish()
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=1)
+        if self.count:
+            queue.put_nowait(self.payload)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+def _reading(value) -> float:
+    # Absent, zero or unparseable readings count as missing
+    try:
+        value = float(value or np.nan)
+    except (TypeError, ValueError):
+        return np.nan
+    return value if np.isfinite(value) else np.nan
+
+def _present(values: np.ndarray) -> np.ndarray:
+    return values[~np.isnan(values)]
+
+def _mean(values: np.ndarray) -> float | None:
+    values = _present(values)
+    return float(values.mean()) if len(values) else None
+
+def empty_payload() -> dict:
+    return {
+        "timestamp_s": None,
+        "heart_rate_bpm": None,
+        "breathing_rate_rpm": None,
+        "mood": None,
+        "mood_context": "No vitals data available"
+    }
+
+class VitalsStore:
+    """
+    One buffer per session, evicted least-recently-used past `max_sessions`
+    and after `idle_ttl` seconds without use. With a shared state backend
+    each new sample is mirrored there, and reads pick up samples posted to
+    other workers.
+    """
+
+    def __init__(self, backend = None, max_sessions: int = VITALS_MAX_SESSIONS, idle_ttl: float = VITALS_IDLE_TTL_S):
+        self.backend = backend or default_backend()
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._buffers = OrderedDict()
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def get(self, session_id: str = "default") -> VitalsBuffer:
+        buffer = self._buffers.get(session_id)
+        if buffer is None:
+            buffer = self._buffers[session_id] = VitalsBuffer()
+        else:
+            self._buffers.move_to_end(session_id)
+        buffer.last_used = time.monotonic()
+        self.evict(keep=session_id)
+        if self.backend.shared:
+            self._refresh(session_id, buffer)
+        return buffer
+
+    def add(self, session_id: str, sample: dict):
+        buffer = self.get(session_id)
+        buffer.add(sample)
+        if self.backend.shared:
+            buffer.rev = uuid.uuid4().hex
+            self.backend.put("vitals", session_id, {**buffer.snapshot(), "rev": buffer.rev})
+
+    def evict(self, keep: str | None = None):
+        evict_lru(self._buffers, self.max_sessions, self.idle_ttl, lambda b: b.has_subscribers, keep)
+
+    def _refresh(self, session_id: str, buffer: VitalsBuffer):
+        data = self.backend.get("vitals", session_id)
+        if data and data.get("rev") != buffer.rev:
+            buffer.load(data)
+
+    async def poll_forever(self, interval: float = VITALS_POLL_S):
+        """
+        Pushes samples posted to other workers to this worker's SSE
+        subscribers. Returns at once when state is not shared.
+        """
+        if not self.backend.shared:
+            return
+        while True:
+            try:
+                for session_id, buffer in list(self._buffers.items()):
+                    if buffer.has_subscribers:
+                        self._refresh(session_id, buffer)
+            except Exception as e:
+                print(f"Error polling vitals: {e}")
+            await asyncio.sleep(interval)
@@ -1,53 +1,103 @@
-import { useEffect, useState } from "react";
+import { useRef, useState } from "react";
 
-export const useAudioRecorder = ({ onAudioRecorded }: { onAudioRecorded: (audioBlob: Blob) => void }) => {
+interface StreamingRecorderOptions {
+  url: string; // ws(s)://.../ws/chat-audio
+  onEndpoint?: () => void; // the server heard the user stop talking
+  onTranscription?: (text: string) => void;
+  onSpeech: (speech: any) => void;
+  onDone?: () => void;
+  onError?: (detail: string) => void;
+}
+
+// Streams microphone audio to the backend while recording. The server decodes
+// as it goes and decides when the user has stopped talking, so the debate
+// starts without waiting for the user to press stop or for an upload.
+export const useAudioRecorder = ({ url, onEndpoint, onTranscription, onSpeech, onDone, onError }: StreamingRecorderOptions) => {
     const [isRecording, setIsRecording] = useState(false);
-    const [mediaRecorder, setMediaRecorder] = useState<MediaRecorder | null>(null);
-    
-    useEffect(() => {
-      console.log("STARTING!!")
-    }, [])
+    const recorderRef = useRef<MediaRecorder | null>(null);
+
+    const stopMicrophone = () => {
+      const recorder = recorderRef.current;
+      recorderRef.current = null;
+      if (recorder) {
+        if (recorder.state !== "inactive") {
+          recorder.stop();
+        }
+        // Also releases the mic when the socket failed before recording started
+        recorder.stream.getTracks().forEach((track) => track.stop());
+      }
+      setIsRecording(false);
+    };
 
-    const startRecording = async () => {
+    // `config` is sent as the first message: user_name, mode, session_id, audio_format, ...
+    const startRecording = async (config: Record<string, unknown>) => {
       try {
-        console.log("Requesting microphone access")
         const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
-        console.log("Microphone access granted.")
-        const recorder = new MediaRecorder(stream);
-
-        let chunks: Blob[] = [];
+        const recorder = MediaRecorder.isTypeSupported("audio/webm")
+          ? new MediaRecorder(stream, { mimeType: "audio/webm" })
+          : new MediaRecorder(stream);
+        recorderRef.current = recorder;
+        const socket = new WebSocket(url);
+        let finished = false; // "done", "error" or a failure was already reported
+        const fail = (detail: string) => {
+          if (finished) return;
+          finished = true;
+          stopMicrophone();
+          onError?.(detail);
+        };
 
         recorder.ondataavailable = (event) => {
-          chunks.push(event.data);
-          console.log("NEW DATA BEING ADDED!!!!");
+          if (event.data.size > 0 && socket.readyState === WebSocket.OPEN) {
+            socket.send(event.data);
+          }
         };
-
         recorder.onstop = () => {
-          console.log("AUDIO CHUNKS!!!!");
-          const audioBlob = new Blob(chunks, { type: "audio/webm" });
-          console.log("Recording stopped. Audio Blob:", audioBlob)
-          onAudioRecorded(audioBlob); // Pass the audio blob to the callback
-        };  
-
-        recorder.start();
-        setMediaRecorder(recorder);
-        console.log("RESETTING TO EMPTY!!!!");
-        setIsRecording(true);
+          // Manual stop before the server heard silence: transcribe what we have
+          if (socket.readyState === WebSocket.OPEN) {
+            socket.send(JSON.stringify({ type: "stop" }));
+          }
+        };
+
+        socket.onopen = () => {
+          socket.send(JSON.stringify({ ...config, encoding: "webm" }));
+          recorder.start(250); // a chunk every 250 ms
+          setIsRecording(true);
+        };
+        socket.onmessage = (event) => {
+          const message = JSON.parse(event.data);
+          if (message.type === "endpoint") {
+            stopMicrophone();
+            onEndpoint?.();
+          } else if (message.type === "transcription") {
+            onTranscription?.(message.text);
+          } else if (message.type === "speech") {
+            onSpeech(message.speech);
+          } else if (message.type === "done") {
+            finished = true;
+            onDone?.();
+            socket.close();
+          } else if (message.type === "error") {
+            fail(message.detail);
+            socket.close();
+          }
+        };
+        socket.onerror = () => fail("Audio connection failed");
+        // A dropped connection may close without an error event
+        socket.onclose = () => fail("Audio connection closed");
       } catch (error) {
         console.error("Error accessing microphone:", error);
         alert("Could not access the microphone. Please check your permissions.");
-        }
-      };
-
-      const stopRecording = () => {
-        if (mediaRecorder) {
-          mediaRecorder.stop();
-          setIsRecording(false);
-          console.log("Stopping recording...");
-        } else {
-          console.error("No active media recording found.");
-        }
-      };
+      }
+    };
+
+    const stopRecording = () => {
+      if (recorderRef.current) {
+        stopMicrophone();
+        console.log("Stopping recording...");
+      } else {
+        console.error("No active media recording found.");
+      }
+    };
 
-      return { isRecording, startRecording, stopRecording };
-      };
\ No newline at end of file
+    return { isRecording, startRecording, stopRecording };
+};
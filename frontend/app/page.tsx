@@ -22,8 +22,17 @@ interface Speech {
   duckId: number;
   text: string;
   duration: number;
-  audioUrl: string;
+  audioUrl: string | null; // null when TTS failed; the line is shown for `duration` ms
   mood?: string; // Dynamic emoji mood
+  envelope?: number[]; // Per-frame loudness 0-100, for lip-sync
+  envelopeFps?: number;
+}
+
+// The whole debate as one file; timeline[i] places conversation[i] in it (ms)
+interface Bundle {
+  audioUrl: string;
+  duration: number;
+  timeline: { offset: number; duration: number }[];
 }
 
 interface Vitals {
@@ -46,6 +55,12 @@ const DUCKS: Duck[] = [
 ];
 
 const BACKEND_URL = "http://localhost:8000";
+// Compressed audio the browser can play directly; the backend falls back to WAV if unset
+const AUDIO_FORMAT = "mp3";
+// Audio URLs start playing while the line is still being synthesized (MP3 only)
+const STREAM_AUDIO = true;
+// Fetch /chat debates as one stitched file instead (one download, no gaps between lines; replaces STREAM_AUDIO there)
+const BUNDLE_AUDIO = false;
 
 export default function Home() {
   const [mode, setMode] = useState<AppMode>("landing");
@@ -60,17 +75,52 @@ export default function Home() {
   const [healthMode, setHealthMode] = useState(false);
   const [vitals, setVitals] = useState<Vitals | null>(null);
   
+  // True while a voice turn is still streaming speeches in; playback waits for them
+  const [awaitingSpeeches, setAwaitingSpeeches] = useState(false);
+  // Set while a bundled debate plays; it drives currentIndex from its timeline
+  const [bundle, setBundle] = useState<Bundle | null>(null);
+
   const { isRecording, startRecording, stopRecording } = useAudioRecorder({
-    onAudioRecorded: (audioBlob: Blob) => {
-      startAudioConversation(audioBlob);
+    url: `${BACKEND_URL.replace(/^http/, "ws")}/ws/chat-audio`,
+    onEndpoint: () => {
+      setIsLoading(true);
+      setConversation([]); // clear old
+      setBundle(null);
+      setDisplayedText("");
+      setAwaitingSpeeches(true);
+      setIsPlaying(true);
+      setCurrentIndex(0);
+    },
+    onTranscription: (text: string) => {
+      console.log("Transcription:", text);
+    },
+    onSpeech: (s: any) => {
+      // Fix audio URLs to be absolute
+      const speech = {
+        ...s,
+        audioUrl: !s.audioUrl || s.audioUrl.startsWith("http") ? s.audioUrl : `${BACKEND_URL}${s.audioUrl}`
+      };
+      setIsLoading(false);
+      setConversation((prev) => [...prev, speech]);
+    },
+    onDone: () => {
+      setIsLoading(false);
+      setAwaitingSpeeches(false);
+      setMessage("");
+    },
+    onError: (detail: string) => {
+      console.error(detail);
+      setIsLoading(false);
+      setAwaitingSpeeches(false);
+      setDisplayedText("Error: Could not summon the ducks. Is the backend running?");
     },
   });
   
   // Refs
   const audioRef = useRef<HTMLAudioElement | null>(null);
-  const vitalsTimerRef = useRef<NodeJS.Timeout | null>(null);
+  const vitalsSourceRef = useRef<EventSource | null>(null);
 
-  // Polling for vitals
+  // Vitals are pushed by the backend as server-sent events
   useEffect(() => {
     if (healthMode) {
       const fetchVitals = async () => {
@@ -86,14 +136,17 @@ export default function Home() {
       };
       
       fetchVitals(); // Initial call
-      vitalsTimerRef.current = setInterval(fetchVitals, 2000); // Poll every 2s
+      vitalsSourceRef.current = new EventSource(`${BACKEND_URL}/vitals/stream`);
+      vitalsSourceRef.current.addEventListener("vitals", (event) => {
+        setVitals(JSON.parse((event as MessageEvent).data));
+      });
     } else {
-      if (vitalsTimerRef.current) clearInterval(vitalsTimerRef.current);
+      vitalsSourceRef.current?.close();
       setVitals(null);
     }
 
     return () => {
-      if (vitalsTimerRef.current) clearInterval(vitalsTimerRef.current);
+      vitalsSourceRef.current?.close();
     };
   }, [healthMode]);
 
@@ -103,6 +156,7 @@ export default function Home() {
     
     setIsLoading(true);
     setConversation([]); // clear old
+    setBundle(null);
     setDisplayedText("");
     
     try {
@@ -113,7 +167,10 @@ export default function Home() {
           message: msgToSend,
           user_name: userName,
           mode: mode === "landing" ? "chat" : mode,
-          turns: turnCount
+          turns: turnCount,
+          audio_format: AUDIO_FORMAT,
+          stream_audio: STREAM_AUDIO,
+          bundle: BUNDLE_AUDIO
         }),
       });
       
@@ -122,10 +179,11 @@ export default function Home() {
       const data = await res.json();
       const speeches = data.speeches.map((s: any) => ({
         ...s,
-        audioUrl: s.audioUrl.startsWith("http") ? s.audioUrl : `${BACKEND_URL}${s.audioUrl}`
+        audioUrl: !s.audioUrl || s.audioUrl.startsWith("http") ? s.audioUrl : `${BACKEND_URL}${s.audioUrl}`
       }));
       
       setConversation(speeches);
+      setBundle(data.bundle ? { ...data.bundle, audioUrl: `${BACKEND_URL}${data.bundle.audioUrl}` } : null);
       setIsLoading(false);
       setIsPlaying(true);
       setCurrentIndex(0);
@@ -137,55 +195,6 @@ export default function Home() {
     }
   };
 
-  const startAudioConversation = async (audioBlob: Blob) => {
-    if (!audioBlob) return;
-    
-    setIsLoading(true);
-    setConversation([]); // clear old
-    setDisplayedText("");
-    
-    try {
-      console.log(audioBlob)
-
-      const formData = new FormData();
-      formData.append("audio", audioBlob, "audio.webm");
-      formData.append("user_name", userName);
-      formData.append("mode", mode === "landing" ? "chat" : mode);
-      formData.append("turns", turnCount.toString());
-
-
-      const res = await fetch(`${BACKEND_URL}/chat-audio`, {
-        method: "POST",
-        body: formData,
-      });
-      
-      if (!res.ok) throw new Error("Failed to fetch debate");
-      
-      const data = await res.json();
-      const { speeches, transcription } = data;
-      
-      console.log("allSpeeches:", speeches);
-      console.log("Transcription:", transcription);
-    
-
-      // Fix audio URLs to be absolute
-      const convo = speeches.map((s: any) => ({
-        ...s,
-        audioUrl: s.audioUrl.startsWith("http") ? s.audioUrl : `${BACKEND_URL}${s.audioUrl}`
-      }));
-      
-      setMessage("");
-      setConversation(convo);
-      setIsLoading(false);
-      setIsPlaying(true);
-      setCurrentIndex(0);
-    } catch (e) {
-      console.error(e);
-      setIsLoading(false);
-      setDisplayedText("Error: Could not summon the ducks. Is the backend running?");
-    }
-  };
-
   // Triggers a single duck to speak
   const pokeDuck = async (duckId: number) => {
     if (isPlaying || isLoading) return;
@@ -200,7 +209,9 @@ export default function Home() {
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ 
           duck_id: duckId,
-          user_name: userName
+          user_name: userName,
+          audio_format: AUDIO_FORMAT,
+          stream_audio: STREAM_AUDIO
         }),
       });
       
@@ -209,7 +220,7 @@ export default function Home() {
       const data = await res.json();
       const speeches = data.speeches.map((s: any) => ({
         ...s,
-        audioUrl: s.audioUrl.startsWith("http") ? s.audioUrl : `${BACKEND_URL}${s.audioUrl}`
+        audioUrl: !s.audioUrl || s.audioUrl.startsWith("http") ? s.audioUrl : `${BACKEND_URL}${s.audioUrl}`
       }));
       
       setConversation(speeches);
@@ -227,6 +238,7 @@ export default function Home() {
     try {
       await fetch(`${BACKEND_URL}/reset`, { method: "POST" });
       setConversation([]);
+      setBundle(null);
       setIsPlaying(false);
       setDisplayedText("");
       alert("The ducks have forgotten everything.");
@@ -243,24 +255,34 @@ export default function Home() {
     setIsPlaying(false);
     setCurrentIndex(-1);
     setDisplayedText("");
+    setBundle(null);
   };
 
+  // Keyed on the speech itself, so lines appended while it plays don't restart it
+  const currentSpeech = currentIndex >= 0 ? conversation[currentIndex] : undefined;
+
   useEffect(() => {
     if (!isPlaying || currentIndex < 0) return;
 
-    if (currentIndex >= conversation.length) {
+    if (!currentSpeech) {
+      if (awaitingSpeeches) return; // the next line is still on its way
       setIsPlaying(false);
       setCurrentIndex(-1); // Reset
       return;
     }
 
-    const currentSpeech = conversation[currentIndex];
     setDisplayedText(currentSpeech.text);
+    if (bundle) return; // the bundle effect below is playing this line
 
     // Play Audio
     if (audioRef.current) {
       audioRef.current.pause();
     }
+
+    if (!currentSpeech.audioUrl) {
+      const timer = setTimeout(() => setCurrentIndex((prev) => prev + 1), currentSpeech.duration);
+      return () => clearTimeout(timer);
+    }
     
     const audio = new Audio(currentSpeech.audioUrl);
     audioRef.current = audio;
@@ -280,7 +302,43 @@ export default function Home() {
       audio.removeEventListener('ended', handleEnded);
       audio.pause();
     };
-  }, [currentIndex, isPlaying, conversation]);
+  }, [currentIndex, isPlaying, currentSpeech, awaitingSpeeches, bundle]);
+
+  // Plays a bundled debate as one file, following its timeline to pick the current line
+  useEffect(() => {
+    if (!bundle || !isPlaying) return;
+
+    const audio = new Audio(bundle.audioUrl);
+    audioRef.current = audio;
+
+    const handleTimeUpdate = () => {
+      const ms = audio.currentTime * 1000;
+      let index = 0;
+      bundle.timeline.forEach((turn, i) => {
+        if (ms >= turn.offset) index = i;
+      });
+      setCurrentIndex(index);
+    };
+    const handleEnded = () => {
+      setBundle(null);
+      setCurrentIndex(bundle.timeline.length);
+    };
+
+    audio.addEventListener('timeupdate', handleTimeUpdate);
+    audio.addEventListener('ended', handleEnded);
+
+    audio.play().catch(err => {
+      // Fall back to the per-turn files from the current line on
+      console.error("Bundle play failed", err);
+      setBundle(null);
+    });
+
+    return () => {
+      audio.removeEventListener('timeupdate', handleTimeUpdate);
+      audio.removeEventListener('ended', handleEnded);
+      audio.pause();
+    };
+  }, [bundle, isPlaying]);
 
   // Helper to get current active duck
   const activeDuckId = currentIndex >= 0 && currentIndex < conversation.length 
@@ -381,7 +439,7 @@ export default function Home() {
 
   // --- Vitals Overlay Component ---
   const VitalsOverlay = () => {
-    if (!healthMode || !vitals) return null;
+    if (!healthMode || !vitals || vitals.heart_rate_bpm == null) return null;
 
     const moodColors = {
       stressed: 'bg-red-900/50 text-red-300 border-red-700',
@@ -767,7 +825,13 @@ export default function Home() {
                   if (isRecording) {
                     stopRecording();
                   } else {
-                    startRecording();
+                    startRecording({
+                      user_name: userName,
+                      mode: mode === "landing" ? "chat" : mode,
+                      turns: turnCount,
+                      audio_format: AUDIO_FORMAT,
+                      stream_audio: STREAM_AUDIO
+                    });
                   }
                 }}
                 disabled={isLoading}